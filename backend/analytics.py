@@ -0,0 +1,203 @@
+"""Columnar multi-season analytics over application events."""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import extract
+from sqlmodel import Session, func, select
+
+from .models import ApplicationEvent, Field
+
+
+@dataclass(frozen=True)
+class EventColumns:
+    """Application events held as parallel NumPy arrays."""
+
+    field_ids: np.ndarray
+    seasons: np.ndarray
+    product_codes: np.ndarray
+    rates: np.ndarray
+    products: np.ndarray
+
+    @classmethod
+    def load(cls, session: Session) -> "EventColumns":
+        rows = session.exec(
+            select(
+                ApplicationEvent.field_id,
+                extract("year", ApplicationEvent.date),
+                ApplicationEvent.product,
+                ApplicationEvent.rate,
+            )
+        ).all()
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(empty, empty, empty, np.empty(0), np.empty(0, dtype=object))
+
+        field_ids, seasons, products, rates = zip(*rows, strict=True)
+        product_names, product_codes = np.unique(
+            np.array(products, dtype=object), return_inverse=True
+        )
+        return cls(
+            field_ids=np.array(field_ids, dtype=np.int64),
+            seasons=np.array(seasons, dtype=np.int64),
+            product_codes=product_codes.astype(np.int64),
+            rates=np.array(rates, dtype=np.float64),
+            products=product_names,
+        )
+
+
+@dataclass(frozen=True)
+class SeasonalComparison:
+    """One row per (field, season, product) with derived comparison metrics."""
+
+    field_ids: np.ndarray
+    seasons: np.ndarray
+    product_codes: np.ndarray
+    total_rates: np.ndarray
+    event_counts: np.ndarray
+    yoy_deltas: np.ndarray
+    percentile_ranks: np.ndarray
+    products: np.ndarray
+
+    @classmethod
+    def compute(cls, columns: EventColumns) -> "SeasonalComparison":
+        n_products = max(len(columns.products), 1)
+        season_values, season_codes = np.unique(columns.seasons, return_inverse=True)
+        n_seasons = max(len(season_values), 1)
+
+        # Pack (field, season, product) into a single int64 key so grouping is
+        # one np.unique call instead of a lexicographic unique over three columns.
+        keys = (columns.field_ids * n_seasons + season_codes) * n_products + columns.product_codes
+        group_keys, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=columns.rates, minlength=len(group_keys))
+        counts = np.bincount(inverse, minlength=len(group_keys))
+
+        product_codes = group_keys % n_products
+        season_codes = (group_keys // n_products) % n_seasons
+        field_ids = group_keys // (n_products * n_seasons)
+        seasons = season_values[season_codes]
+
+        return cls(
+            field_ids=field_ids,
+            seasons=seasons,
+            product_codes=product_codes,
+            total_rates=totals,
+            event_counts=counts,
+            yoy_deltas=_year_over_year(field_ids, product_codes, seasons, totals),
+            percentile_ranks=_percentile_ranks(seasons, product_codes, totals),
+            products=columns.products,
+        )
+
+    def rows(
+        self,
+        *,
+        field_id: Optional[int] = None,
+        season: Optional[int] = None,
+        product: Optional[str] = None,
+    ) -> list[dict]:
+        mask = np.ones(len(self.field_ids), dtype=bool)
+        if field_id is not None:
+            mask &= self.field_ids == field_id
+        if season is not None:
+            mask &= self.seasons == season
+        if product is not None:
+            matches = np.flatnonzero(self.products == product)
+            if not len(matches):
+                return []
+            mask &= self.product_codes == matches[0]
+
+        indices = np.flatnonzero(mask)
+        deltas = self.yoy_deltas[indices]
+        return [
+            {
+                "field_id": int(field),
+                "season": int(season_),
+                "product": str(self.products[code]),
+                "total_rate": float(total),
+                "event_count": int(count),
+                "yoy_delta": None if np.isnan(delta) else float(delta),
+                "percentile_rank": float(rank),
+            }
+            for field, season_, code, total, count, delta, rank in zip(
+                self.field_ids[indices],
+                self.seasons[indices],
+                self.product_codes[indices],
+                self.total_rates[indices],
+                self.event_counts[indices],
+                deltas,
+                self.percentile_ranks[indices],
+                strict=True,
+            )
+        ]
+
+
+def _year_over_year(
+    field_ids: np.ndarray, product_codes: np.ndarray, seasons: np.ndarray, totals: np.ndarray
+) -> np.ndarray:
+    """Change from the same field and product in the immediately preceding season."""
+    deltas = np.full(len(totals), np.nan)
+    if len(totals) < 2:
+        return deltas
+
+    order = np.lexsort((seasons, product_codes, field_ids))
+    f, p, s, t = field_ids[order], product_codes[order], seasons[order], totals[order]
+    has_previous = (f[1:] == f[:-1]) & (p[1:] == p[:-1]) & (s[1:] == s[:-1] + 1)
+    sorted_deltas = np.full(len(totals), np.nan)
+    sorted_deltas[1:] = np.where(has_previous, t[1:] - t[:-1], np.nan)
+    deltas[order] = sorted_deltas
+    return deltas
+
+
+def _percentile_ranks(
+    seasons: np.ndarray, product_codes: np.ndarray, totals: np.ndarray
+) -> np.ndarray:
+    """Percent of other fields with a lower total for the same season and product."""
+    ranks = np.zeros(len(totals))
+    if not len(totals):
+        return ranks
+
+    order = np.lexsort((totals, product_codes, seasons))
+    s, p, t = seasons[order], product_codes[order], totals[order]
+    positions = np.arange(len(t))
+
+    new_group = np.r_[True, (s[1:] != s[:-1]) | (p[1:] != p[:-1])]
+    group_start = np.maximum.accumulate(np.where(new_group, positions, 0))
+    new_value = new_group | np.r_[True, t[1:] != t[:-1]]
+    value_start = np.maximum.accumulate(np.where(new_value, positions, 0))
+
+    group_ids = np.cumsum(new_group) - 1
+    group_sizes = np.bincount(group_ids)[group_ids]
+    below = value_start - group_start
+    sorted_ranks = np.where(
+        group_sizes > 1, 100.0 * below / np.maximum(group_sizes - 1, 1), 100.0
+    )
+    ranks[order] = sorted_ranks
+    return ranks
+
+
+class SeasonalComparisonCache:
+    """Holds the computed comparison keyed by the sum of field event revisions.
+
+    Every added event bumps its field's revision, so a changed sum means the
+    columns must be reloaded; unchanged data costs one aggregate over fields.
+    """
+
+    def __init__(self) -> None:
+        self._entry: Optional[tuple[int, SeasonalComparison]] = None
+
+    def get(self, session: Session) -> SeasonalComparison:
+        revision = session.exec(select(func.coalesce(func.sum(Field.event_revision), 0))).one()
+        entry = self._entry
+        if entry is not None and entry[0] == revision:
+            return entry[1]
+
+        comparison = SeasonalComparison.compute(EventColumns.load(session))
+        self._entry = (revision, comparison)
+        return comparison
+
+    def clear(self) -> None:
+        self._entry = None
+
+
+seasonal_comparison_cache = SeasonalComparisonCache()
@@ -0,0 +1,185 @@
+"""Season-end bulk invoicing from recorded field applications."""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import String, cast, exists, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Invoices flushed and committed together; progress is visible per batch.
+BATCH_SIZE = 200
+ACTIVE_STATUSES = models.ACTIVE_BILLING_RUN_STATUSES
+# An active run with no heartbeat for this long is presumed lost to a crash.
+STALE_RUN_SECONDS = float(os.getenv("BILLING_RUN_STALE_SECONDS", "900"))
+
+logger = logging.getLogger(__name__)
+# Serializes runs within this process only. The single-active-run guarantee
+# across processes comes from the uq_billing_runs_one_active index.
+_run_lock = threading.Lock()
+
+
+class BillingRunConflict(Exception):
+    """Raised when a billing run is requested while another is still active."""
+
+
+def queue_run(
+    db: Session, period_start: date, period_end: date, group_by: str
+) -> models.BillingRun:
+    """Insert a queued run; the partial unique index rejects it if another is active."""
+    fail_stale_runs(db)
+    run = models.BillingRun(period_start=period_start, period_end=period_end, group_by=group_by)
+    db.add(run)
+    try:
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        raise BillingRunConflict("A billing run is already in progress") from exc
+    db.refresh(run)
+    return run
+
+
+def fail_stale_runs(db: Session, now: Optional[datetime] = None) -> int:
+    """Mark active runs without a recent heartbeat as failed; return how many."""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=STALE_RUN_SECONDS)
+    heartbeat = models.BillingRun.heartbeat_at
+    result = db.execute(
+        update(models.BillingRun)
+        .where(
+            models.BillingRun.status.in_(ACTIVE_STATUSES),
+            (heartbeat < cutoff) | (heartbeat.is_(None) & (models.BillingRun.created_at < cutoff)),
+        )
+        .values(
+            status=models.BillingRunStatus.failed,
+            finished_at=now,
+            error=f"No heartbeat for {STALE_RUN_SECONDS:g}s; presumed interrupted",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        logger.warning("Failed %d stale billing run(s)", result.rowcount)
+    return result.rowcount
+
+
+def execute_run(
+    session_factory: Callable[[], Session],
+    run_id: int,
+    prices: Dict[str, float],
+    due_in_days: int,
+) -> None:
+    """Generate invoices for unbilled applications; safe to re-run for a period."""
+    with _run_lock:
+        db = session_factory()
+        run = db.get(models.BillingRun, run_id)
+        try:
+            run.status = models.BillingRunStatus.running
+            run.heartbeat_at = datetime.utcnow()
+            db.commit()
+            _bill_applications(db, run, prices, due_in_days)
+            run.status = models.BillingRunStatus.completed
+        except Exception as exc:
+            logger.exception("Billing run %s failed", run_id)
+            db.rollback()
+            run.status = models.BillingRunStatus.failed
+            run.error = str(exc)
+        finally:
+            run.finished_at = datetime.utcnow()
+            db.commit()
+            db.close()
+
+
+def _unbilled_applications(db: Session, run: models.BillingRun):
+    application = models.FieldApplication
+    reference = literal("application:") + cast(application.id, String)
+    already_billed = exists().where(models.LineItem.billable_reference == reference)
+    query = (
+        select(
+            models.Field.farmer_id,
+            application.field_id,
+            models.Field.name,
+            application.id,
+            application.product,
+            application.quantity,
+            application.applied_on,
+        )
+        .join(models.Field, models.Field.id == application.field_id)
+        .where(
+            application.applied_on >= run.period_start,
+            application.applied_on <= run.period_end,
+            ~already_billed,
+        )
+        .order_by(
+            models.Field.farmer_id, application.field_id, application.applied_on, application.id
+        )
+    )
+    return db.execute(query).all()
+
+
+def _bill_applications(
+    db: Session, run: models.BillingRun, prices: Dict[str, float], due_in_days: int
+) -> None:
+    price_list = {product.strip().lower(): price for product, price in prices.items()}
+    issue_date = date.today()
+    due_date = issue_date + timedelta(days=due_in_days)
+    notes = f"Billing run #{run.id}: {run.period_start} to {run.period_end}"
+
+    def group_key(row):
+        return row.farmer_id if run.group_by == "farmer" else (row.farmer_id, row.field_id)
+
+    pending: List[models.Invoice] = []
+    for _, rows in groupby(_unbilled_applications(db, run), key=group_key):
+        rows = list(rows)
+        line_items = []
+        for row in rows:
+            price = price_list.get(row.product.strip().lower())
+            if price is None:
+                run.skipped_unpriced += 1
+                continue
+            line_items.append(
+                models.LineItem(
+                    description=f"{row.product} - {row.name} ({row.applied_on})",
+                    quantity=row.quantity,
+                    unit_price=price,
+                    tax_rate=0.0,
+                    position=len(line_items),
+                    billable_reference=f"application:{row.id}",
+                )
+            )
+        if not line_items:
+            continue
+
+        invoice = models.Invoice(
+            farmer_id=rows[0].farmer_id,
+            field_id=rows[0].field_id if run.group_by == "field" else None,
+            issue_date=issue_date,
+            due_date=due_date,
+            notes=notes,
+            line_items=line_items,
+        )
+        invoice.recalculate_totals()
+        pending.append(invoice)
+        run.line_items_created += len(line_items)
+        if len(pending) >= BATCH_SIZE:
+            _commit_batch(db, run, pending)
+            pending = []
+
+    if pending:
+        _commit_batch(db, run, pending)
+
+
+def _commit_batch(db: Session, run: models.BillingRun, invoices: List[models.Invoice]) -> None:
+    # add_all + one flush lets SQLAlchemy emit multi-row INSERTs per table.
+    db.add_all(invoices)
+    run.invoices_created += len(invoices)
+    run.heartbeat_at = datetime.utcnow()
+    db.commit()
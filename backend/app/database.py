@@ -1,12 +1,19 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+from fieldflux.db import create_sqlite_engine
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./fieldflux.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL, name="billing")
+
+
+class BillingSession(Session):
+    """Session for the billing database; billing flush hooks listen on this class only."""
+
+
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=BillingSession
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
@@ -0,0 +1,164 @@
+"""Accounts-receivable aggregates computed in SQL.
+
+SQLite sums Float and Numeric columns as doubles, so every amount is rounded
+to integer cents before it is aggregated and only converted back to dollars
+for the response.
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import Integer, and_, case, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import models, money
+
+AGING_BUCKETS = (
+    ("days_0_30", None, 30),
+    ("days_31_60", 31, 60),
+    ("days_61_90", 61, 90),
+    ("days_over_90", 91, None),
+)
+OPEN_STATUSES = (
+    models.InvoiceStatus.sent,
+    models.InvoiceStatus.partial,
+    models.InvoiceStatus.overdue,
+)
+
+
+def _cents(amount):
+    return cast(func.round(amount * 100), Integer)
+
+
+def _paid_per_invoice():
+    return (
+        select(
+            models.PaymentRecord.invoice_id.label("invoice_id"),
+            func.sum(_cents(models.PaymentRecord.amount)).label("paid"),
+        )
+        .group_by(models.PaymentRecord.invoice_id)
+        .subquery()
+    )
+
+
+def farmer_balances(db: Session, farmer_id: Optional[int] = None) -> List[dict]:
+    """Billed, paid and outstanding totals per farmer in one grouped query."""
+    paid = _paid_per_invoice()
+    billed_total = func.coalesce(func.sum(_cents(models.Invoice.total)), 0)
+    paid_total = func.coalesce(func.sum(paid.c.paid), 0)
+    query = (
+        select(
+            models.Farmer.id,
+            models.Farmer.name,
+            billed_total.label("billed"),
+            paid_total.label("paid"),
+        )
+        .outerjoin(models.Invoice, models.Invoice.farmer_id == models.Farmer.id)
+        .outerjoin(paid, paid.c.invoice_id == models.Invoice.id)
+        .group_by(models.Farmer.id, models.Farmer.name)
+        .order_by(models.Farmer.id)
+    )
+    if farmer_id is not None:
+        query = query.where(models.Farmer.id == farmer_id)
+
+    return [
+        {
+            "farmer_id": row.id,
+            "name": row.name,
+            "billed": money.to_float(row.billed),
+            "paid": money.to_float(row.paid),
+            "outstanding_balance": money.to_float(row.billed - row.paid),
+        }
+        for row in db.execute(query)
+    ]
+
+
+def aging_report(db: Session, today: Optional[date] = None) -> List[dict]:
+    """Outstanding balances of open invoices bucketed by days past due."""
+    paid = _paid_per_invoice()
+    outstanding = _cents(models.Invoice.total) - func.coalesce(paid.c.paid, 0)
+    # Invoices without a due date age from their issue date.
+    days_past_due = func.julianday(today or date.today()) - func.julianday(
+        func.coalesce(models.Invoice.due_date, models.Invoice.issue_date)
+    )
+
+    bucket_columns = []
+    for name, low, high in AGING_BUCKETS:
+        conditions = []
+        if low is not None:
+            conditions.append(days_past_due >= low)
+        if high is not None:
+            conditions.append(days_past_due <= high)
+        bucket_columns.append(
+            func.coalesce(func.sum(case((and_(*conditions), outstanding), else_=0)), 0).label(name)
+        )
+
+    query = (
+        select(models.Farmer.id, models.Farmer.name, *bucket_columns)
+        .join(models.Invoice, models.Invoice.farmer_id == models.Farmer.id)
+        .outerjoin(paid, paid.c.invoice_id == models.Invoice.id)
+        .where(models.Invoice.status.in_(OPEN_STATUSES))
+        .group_by(models.Farmer.id, models.Farmer.name)
+        .order_by(models.Farmer.id)
+    )
+
+    report = []
+    for row in db.execute(query):
+        buckets = {name: row._mapping[name] for name, _, _ in AGING_BUCKETS}
+        report.append(
+            {
+                "farmer_id": row.id,
+                "name": row.name,
+                **{name: money.to_float(cents) for name, cents in buckets.items()},
+                "total": money.to_float(sum(buckets.values())),
+            }
+        )
+    return report
+
+
+def invoice_stats(
+    db: Session,
+    farmer_id: Optional[int] = None,
+    issued_from: Optional[date] = None,
+    issued_to: Optional[date] = None,
+) -> dict:
+    """Invoice counts and totals per status and per issue month.
+
+    Both groupings filter on (farmer_id, status, issue_date) prefixes, which
+    the composite indexes on ``invoices`` cover.
+    """
+    conditions = []
+    if farmer_id is not None:
+        conditions.append(models.Invoice.farmer_id == farmer_id)
+    if issued_from:
+        conditions.append(models.Invoice.issue_date >= issued_from)
+    if issued_to:
+        conditions.append(models.Invoice.issue_date <= issued_to)
+
+    count = func.count(models.Invoice.id).label("count")
+    amount = func.coalesce(func.sum(_cents(models.Invoice.total)), 0).label("total")
+    month = func.strftime("%Y-%m", models.Invoice.issue_date).label("month")
+    status_rows = db.execute(
+        select(models.Invoice.status, count, amount)
+        .where(*conditions)
+        .group_by(models.Invoice.status)
+        .order_by(models.Invoice.status)
+    ).all()
+    by_status = [
+        {"status": row.status, "count": row.count, "total": money.to_float(row.total)}
+        for row in status_rows
+    ]
+    by_month = [
+        {"month": row.month, "count": row.count, "total": money.to_float(row.total)}
+        for row in db.execute(
+            select(month, count, amount).where(*conditions).group_by(month).order_by(month)
+        )
+    ]
+    return {
+        "count": sum(row.count for row in status_rows),
+        "total": money.to_float(sum(row.total for row in status_rows)),
+        "by_status": by_status,
+        "by_month": by_month,
+    }
@@ -1,19 +1,22 @@
 from __future__ import annotations
 
 from datetime import date
-from io import BytesIO
-from typing import Annotated, List
+from io import TextIOWrapper
+from typing import Annotated, List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, StreamingResponse
-from fpdf import FPDF
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload, sessionmaker
 
-from . import models, schemas
-from .database import Base, engine, get_db
+from fieldflux.db import migrate_schema
+from fieldflux.instrumentation import instrument_app
 
-Base.metadata.create_all(bind=engine)
+from . import billing, ledger, models, reconciliation, rendering, schemas
+from .database import Base, BillingSession, SessionLocal, engine, get_db
+from .sweeper import overdue_sweeper
 
 app = FastAPI(title="FieldFlux Billing")
 app.add_middleware(
@@ -22,22 +25,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+instrument_app(app, "billing")
 
+INVOICE_PAGE_SIZE = 100
+MAX_INVOICE_PAGE_SIZE = 500
 
-def _calculate_totals(invoice: models.Invoice):
-    subtotal = sum(item.quantity * item.unit_price for item in invoice.line_items)
-    tax_amount = subtotal * (invoice.tax_rate or 0)
-    discount_amount = subtotal * (invoice.discount_rate or 0)
-    invoice.subtotal = round(subtotal, 2)
-    invoice.total = round(subtotal + tax_amount - discount_amount, 2)
 
-    if (
-        invoice.status == models.InvoiceStatus.sent
-        and invoice.due_date
-        and invoice.due_date < date.today()
-    ):
-        invoice.status = models.InvoiceStatus.overdue
+@app.on_event("startup")
+def on_startup() -> None:
+    migrate_schema(engine, Base.metadata)
+    with SessionLocal() as db:
+        billing.fail_stale_runs(db)
+    rendering.compile_templates()
+    overdue_sweeper.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    overdue_sweeper.stop()
+    rendering.shutdown_pdf_executor()
 
 
 @app.post("/farmers", response_model=schemas.FarmerOut)
@@ -117,27 +125,150 @@ def create_invoice(
         )
         invoice_obj.line_items.extend(auto_items)
 
-    _calculate_totals(invoice_obj)
+    invoice_obj.recalculate_totals()
     db.add(invoice_obj)
     db.commit()
     db.refresh(invoice_obj)
     return invoice_obj
 
 
+@app.post("/field-applications", response_model=List[schemas.FieldApplicationOut])
+def create_field_applications(
+    applications: List[schemas.FieldApplicationCreate],
+    db: Annotated[Session, Depends(get_db)],
+):
+    field_ids = {application.field_id for application in applications}
+    known = {
+        field_id
+        for (field_id,) in db.query(models.Field.id).filter(models.Field.id.in_(field_ids))
+    }
+    if field_ids - known:
+        raise HTTPException(status_code=404, detail="Field not found")
+
+    records = [models.FieldApplication(**application.dict()) for application in applications]
+    db.add_all(records)
+    db.commit()
+    return records
+
+
+@app.post("/billing-runs", response_model=schemas.BillingRunOut, status_code=202)
+def create_billing_run(
+    request: schemas.BillingRunCreate,
+    background_tasks: BackgroundTasks,
+    db: Annotated[Session, Depends(get_db)],
+):
+    if request.end_date < request.start_date:
+        raise HTTPException(status_code=422, detail="end_date must not precede start_date")
+    try:
+        run = billing.queue_run(db, request.start_date, request.end_date, request.group_by)
+    except billing.BillingRunConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+    session_factory = sessionmaker(
+        autocommit=False, autoflush=False, bind=db.get_bind(), class_=BillingSession
+    )
+    background_tasks.add_task(
+        billing.execute_run, session_factory, run.id, request.prices, request.due_in_days
+    )
+    return run
+
+
+@app.get("/billing-runs/{run_id}", response_model=schemas.BillingRunOut)
+def get_billing_run(run_id: int, db: Annotated[Session, Depends(get_db)]):
+    run = db.get(models.BillingRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Billing run not found")
+    return run
+
+
+def _invoice_with_relations(db: Session):
+    return db.query(models.Invoice).options(
+        joinedload(models.Invoice.farmer),
+        joinedload(models.Invoice.field),
+        selectinload(models.Invoice.line_items),
+        selectinload(models.Invoice.payments),
+    )
+
+
 @app.get("/invoices", response_model=List[schemas.InvoiceOut])
-def list_invoices(db: Annotated[Session, Depends(get_db)]):
-    invoices = db.query(models.Invoice).all()
-    for inv in invoices:
-        _calculate_totals(inv)
+def list_invoices(
+    response: Response,
+    db: Annotated[Session, Depends(get_db)],
+    farmer_id: Optional[int] = None,
+    status: Optional[models.InvoiceStatus] = None,
+    issued_from: Annotated[Optional[date], Query(alias="from")] = None,
+    issued_to: Annotated[Optional[date], Query(alias="to")] = None,
+    after_id: Optional[int] = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_INVOICE_PAGE_SIZE)] = INVOICE_PAGE_SIZE,
+):
+    query = _invoice_with_relations(db)
+    if farmer_id is not None:
+        query = query.filter(models.Invoice.farmer_id == farmer_id)
+    if status is not None:
+        query = query.filter(models.Invoice.status == status)
+    if issued_from:
+        query = query.filter(models.Invoice.issue_date >= issued_from)
+    if issued_to:
+        query = query.filter(models.Invoice.issue_date <= issued_to)
+    if after_id is not None:
+        query = query.filter(models.Invoice.id > after_id)
+
+    # Fetch one extra row to learn whether another page exists.
+    invoices = query.order_by(models.Invoice.id).limit(limit + 1).all()
+    if len(invoices) > limit:
+        invoices = invoices[:limit]
+        response.headers["X-Next-Cursor"] = str(invoices[-1].id)
     return invoices
 
 
+def _export_snapshots(
+    db: Session,
+    farmer_id: Optional[int],
+    issued_from: Optional[date],
+    issued_to: Optional[date],
+) -> List[dict]:
+    query = _invoice_with_relations(db)
+    if farmer_id is not None:
+        query = query.filter(models.Invoice.farmer_id == farmer_id)
+    if issued_from:
+        query = query.filter(models.Invoice.issue_date >= issued_from)
+    if issued_to:
+        query = query.filter(models.Invoice.issue_date <= issued_to)
+    return [rendering.invoice_snapshot(invoice) for invoice in query.order_by(models.Invoice.id)]
+
+
+# Registered before /invoices/{invoice_id} so the literal paths are not parsed as ids.
+@app.get("/invoices/stats", response_model=schemas.InvoiceStatsOut)
+def invoice_stats(
+    db: Annotated[Session, Depends(get_db)],
+    farmer_id: Optional[int] = None,
+    issued_from: Annotated[Optional[date], Query(alias="from")] = None,
+    issued_to: Annotated[Optional[date], Query(alias="to")] = None,
+):
+    return ledger.invoice_stats(db, farmer_id, issued_from, issued_to)
+
+
+@app.get("/invoices/export.zip")
+async def export_invoices_zip(
+    db: Annotated[Session, Depends(get_db)],
+    farmer_id: Optional[int] = None,
+    issued_from: Annotated[Optional[date], Query(alias="from")] = None,
+    issued_to: Annotated[Optional[date], Query(alias="to")] = None,
+):
+    snapshots = await run_in_threadpool(
+        _export_snapshots, db, farmer_id, issued_from, issued_to
+    )
+    headers = {"Content-Disposition": "attachment; filename=invoices.zip"}
+    return StreamingResponse(
+        rendering.pdf_zip_chunks(snapshots), media_type="application/zip", headers=headers
+    )
+
+
 @app.get("/invoices/{invoice_id}", response_model=schemas.InvoiceOut)
 def get_invoice(invoice_id: int, db: Annotated[Session, Depends(get_db)]):
     invoice = db.get(models.Invoice, invoice_id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    _calculate_totals(invoice)
     return invoice
 
 
@@ -151,7 +282,6 @@ def update_invoice_status(
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     invoice.status = status_update.status
-    _calculate_totals(invoice)
     db.commit()
     db.refresh(invoice)
     return invoice
@@ -182,97 +312,99 @@ def record_payment(
     else:
         invoice.status = models.InvoiceStatus.partial
 
-    _calculate_totals(invoice)
     db.commit()
     db.refresh(invoice)
     return invoice
 
 
+@app.post("/payments/reconcile", response_model=schemas.ReconciliationReportOut)
+def reconcile_payments(statement: UploadFile, db: Annotated[Session, Depends(get_db)]):
+    stream = TextIOWrapper(statement.file, encoding="utf-8-sig", newline="")
+    try:
+        report = reconciliation.reconcile(db, reconciliation.read_bank_rows(stream))
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return report.as_dict()
+
+
+@app.get("/farmers/balances", response_model=List[schemas.FarmerBalanceOut])
+def farmer_balances(db: Annotated[Session, Depends(get_db)]):
+    return ledger.farmer_balances(db)
+
+
 @app.get("/farmers/{farmer_id}/balance")
 def farmer_balance(farmer_id: int, db: Annotated[Session, Depends(get_db)]):
+    balances = ledger.farmer_balances(db, farmer_id=farmer_id)
+    if not balances:
+        raise HTTPException(status_code=404, detail="Farmer not found")
+    return {"farmer_id": farmer_id, "outstanding_balance": balances[0]["outstanding_balance"]}
+
+
+@app.get("/farmers/{farmer_id}/statement", response_class=HTMLResponse)
+def farmer_statement(
+    farmer_id: int, db: Annotated[Session, Depends(get_db)], as_of: Optional[date] = None
+):
     farmer = db.get(models.Farmer, farmer_id)
     if not farmer:
         raise HTTPException(status_code=404, detail="Farmer not found")
-    total_due = 0.0
-    for invoice in farmer.invoices:
-        _calculate_totals(invoice)
-        total_due += invoice.outstanding_balance()
-    return {"farmer_id": farmer_id, "outstanding_balance": round(total_due, 2)}
-
-
-def _invoice_html(invoice: models.Invoice) -> str:
-    _calculate_totals(invoice)
-    items_html = "".join(
-        f"<tr><td>{item.description}</td><td>{item.quantity}</td><td>${item.unit_price:.2f}</td><td>${item.line_total():.2f}</td></tr>"
-        for item in invoice.line_items
+    invoices = (
+        _invoice_with_relations(db)
+        .filter(
+            models.Invoice.farmer_id == farmer_id,
+            models.Invoice.status.in_(ledger.OPEN_STATUSES),
+        )
+        .order_by(models.Invoice.issue_date, models.Invoice.id)
+        .all()
     )
-    payments_html = "".join(
-        f"<li>{payment.date.date()} - ${payment.amount:.2f} via {payment.method or 'N/A'}</li>"
-        for payment in invoice.payments
+    snapshots = [rendering.invoice_snapshot(invoice) for invoice in invoices]
+    as_of = as_of or date.today()
+    return HTMLResponse(
+        content=rendering.render_statement_html(farmer, snapshots, as_of.isoformat())
     )
-    return f"""
-    <html>
-        <head><title>Invoice #{invoice.id}</title></head>
-        <body>
-            <h1>Invoice #{invoice.id}</h1>
-            <p>Status: {invoice.status.value.title()}</p>
-            <p>Farmer: {invoice.farmer.name} ({invoice.farmer.email or 'no email'})</p>
-            <p>Field: {invoice.field.name if invoice.field else 'N/A'}</p>
-            <p>Issue Date: {invoice.issue_date} | Due: {invoice.due_date or 'N/A'}</p>
-            <table border="1" cellspacing="0" cellpadding="4">
-                <tr><th>Description</th><th>Qty</th><th>Unit Price</th><th>Total</th></tr>
-                {items_html}
-            </table>
-            <p>Subtotal: ${invoice.subtotal:.2f}</p>
-            <p>
-                Tax Rate: {invoice.tax_rate * 100:.1f}% | Discount:
-                {invoice.discount_rate * 100:.1f}%
-            </p>
-            <p><strong>Amount Due: ${invoice.total:.2f}</strong></p>
-            <p>Payments:</p>
-            <ul>{payments_html or '<li>No payments yet</li>'}</ul>
-            <p>Notes: {invoice.notes or 'None'}</p>
-        </body>
-    </html>
-    """
+
+
+@app.get("/reports/aging", response_model=List[schemas.AgingRowOut])
+def aging_report(db: Annotated[Session, Depends(get_db)], as_of: Optional[date] = None):
+    return ledger.aging_report(db, today=as_of)
+
+
+def _invoice_revision(db: Session, invoice_id: int) -> Optional[int]:
+    return db.scalar(select(models.Invoice.revision).where(models.Invoice.id == invoice_id))
+
+
+def _invoice_snapshot(db: Session, invoice_id: int) -> Optional[dict]:
+    invoice = (
+        _invoice_with_relations(db).filter(models.Invoice.id == invoice_id).one_or_none()
+    )
+    return rendering.invoice_snapshot(invoice) if invoice else None
 
 
 @app.get("/invoices/{invoice_id}/html", response_class=HTMLResponse)
 def invoice_html(invoice_id: int, db: Annotated[Session, Depends(get_db)]):
-    invoice = db.get(models.Invoice, invoice_id)
-    if not invoice:
+    revision = _invoice_revision(db, invoice_id)
+    if revision is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    return HTMLResponse(content=_invoice_html(invoice))
+    path = rendering.render_cache.get(invoice_id, revision, "html")
+    if path is not None:
+        return HTMLResponse(content=path.read_text(encoding="utf-8"))
+
+    snapshot = _invoice_snapshot(db, invoice_id)
+    html = rendering.render_invoice_html(snapshot)
+    rendering.render_cache.put(invoice_id, snapshot["revision"], "html", html.encode("utf-8"))
+    return HTMLResponse(content=html)
 
 
 @app.get("/invoices/{invoice_id}/pdf")
-def invoice_pdf(invoice_id: int, db: Annotated[Session, Depends(get_db)]):
-    invoice = db.get(models.Invoice, invoice_id)
-    if not invoice:
+async def invoice_pdf(invoice_id: int, db: Annotated[Session, Depends(get_db)]):
+    revision = await run_in_threadpool(_invoice_revision, db, invoice_id)
+    if revision is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(40, 10, f"Invoice #{invoice.id}")
-    pdf.ln(12)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 10, f"Farmer: {invoice.farmer.name}", ln=True)
-    pdf.cell(0, 10, f"Field: {invoice.field.name if invoice.field else 'N/A'}", ln=True)
-    pdf.cell(0, 10, f"Status: {invoice.status.value}", ln=True)
-
-    pdf.ln(5)
-    for item in invoice.line_items:
-        pdf.cell(0, 8, f"- {item.description} ({item.quantity} @ ${item.unit_price:.2f})", ln=True)
-    pdf.ln(3)
-    pdf.cell(0, 8, f"Subtotal: ${invoice.subtotal:.2f}", ln=True)
-    pdf.cell(
-        0,
-        8,
-        f"Tax: {invoice.tax_rate*100:.1f}% | Discount: {invoice.discount_rate*100:.1f}%",
-        ln=True,
-    )
-    pdf.cell(0, 8, f"Total Due: ${invoice.total:.2f}", ln=True)
-
-    buffer = BytesIO(pdf.output(dest="S").encode("latin-1"))
-    headers = {"Content-Disposition": f"inline; filename=invoice-{invoice.id}.pdf"}
-    return StreamingResponse(buffer, media_type="application/pdf", headers=headers)
+    path = rendering.render_cache.get(invoice_id, revision, "pdf")
+    if path is None:
+        snapshot = await run_in_threadpool(_invoice_snapshot, db, invoice_id)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        path = await rendering.cached_pdf(snapshot)
+
+    headers = {"Content-Disposition": f"inline; filename=invoice-{invoice_id}.pdf"}
+    return FileResponse(path, media_type="application/pdf", headers=headers)
@@ -10,15 +10,25 @@ from sqlalchemy import (
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
     Text,
     UniqueConstraint,
+    event,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, relationship
 
-from .database import Base
+from . import money
+from .database import Base, BillingSession
+
+
+class BillingRunStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
 
 
 class InvoiceStatus(str, enum.Enum):
@@ -55,6 +65,11 @@ class Field(Base):
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        Index("ix_invoices_farmer_status_issue", "farmer_id", "status", "issue_date"),
+        Index("ix_invoices_status_due", "status", "due_date"),
+        Index("ix_invoices_issue_status", "issue_date", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     farmer_id = Column(Integer, ForeignKey("farmers.id", ondelete="CASCADE"), nullable=False)
@@ -67,6 +82,9 @@ class Invoice(Base):
     discount_rate = Column(Float, default=0.0)
     total = Column(Numeric(10, 2), default=0)
     notes = Column(Text, nullable=True)
+    # Bumped on every change to the invoice, its line items or its payments;
+    # rendered documents are cached per revision.
+    revision = Column(Integer, default=0, nullable=False)
 
     farmer = relationship("Farmer", back_populates="invoices")
     field = relationship("Field", back_populates="invoices")
@@ -83,39 +101,125 @@ class Invoice(Base):
         order_by="PaymentRecord.date",
     )
 
+    def recalculate_totals(self) -> None:
+        """Persist subtotal/total; call whenever line items or rates change."""
+        totals = money.invoice_totals(
+            ((item.quantity, item.unit_price, item.tax_rate) for item in self.line_items),
+            self.tax_rate,
+            self.discount_rate,
+        )
+        self.subtotal = money.to_decimal(totals.subtotal)
+        self.total = money.to_decimal(totals.total)
+
     def outstanding_balance(self) -> float:
-        paid_total = sum((payment.amount for payment in self.payments), 0.0)
-        return float(self.total) - float(paid_total)
+        paid_cents = sum(money.to_cents(payment.amount) for payment in self.payments)
+        return money.to_float(money.to_cents(self.total) - paid_cents)
 
 
 class LineItem(Base):
     __tablename__ = "line_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False)
+    invoice_id = Column(
+        Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False, index=True
+    )
     description = Column(String, nullable=False)
     quantity = Column(Float, default=1.0)
     unit_price = Column(Float, default=0.0)
     tax_rate = Column(Float, default=0.0)
     position = Column(Integer, default=0)
-    billable_reference = Column(String, nullable=True)
+    billable_reference = Column(String, nullable=True, index=True)
 
     invoice = relationship("Invoice", back_populates="line_items")
 
     def line_total(self) -> float:
-        base = self.quantity * self.unit_price
-        return base + base * self.tax_rate
+        base = money.line_cents(self.quantity, self.unit_price)
+        return money.to_float(base + money.apply_rate(base, self.tax_rate))
 
 
 class PaymentRecord(Base):
     __tablename__ = "payment_records"
 
     id = Column(Integer, primary_key=True, index=True)
-    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False)
+    invoice_id = Column(
+        Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False, index=True
+    )
     amount = Column(Float, nullable=False)
     method = Column(String, nullable=True)
-    reference = Column(String, nullable=True)
+    reference = Column(String, nullable=True, index=True)
     date = Column(DateTime, default=datetime.utcnow, nullable=False)
     notes = Column(Text, nullable=True)
 
     invoice = relationship("Invoice", back_populates="payments")
+
+
+class FieldApplication(Base):
+    __tablename__ = "field_applications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    field_id = Column(Integer, ForeignKey("fields.id", ondelete="CASCADE"), nullable=False)
+    product = Column(String, nullable=False)
+    quantity = Column(Float, nullable=False, default=1.0)
+    applied_on = Column(Date, nullable=False, index=True)
+    notes = Column(Text, nullable=True)
+
+    field = relationship("Field")
+
+    @property
+    def billable_reference(self) -> str:
+        return f"application:{self.id}"
+
+
+class BillingRun(Base):
+    __tablename__ = "billing_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(Enum(BillingRunStatus), default=BillingRunStatus.queued, nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    group_by = Column(String, nullable=False, default="farmer")
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Touched when the run starts and after every committed batch; an active
+    # run whose heartbeat goes stale is presumed dead and failed.
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    invoices_created = Column(Integer, default=0, nullable=False)
+    line_items_created = Column(Integer, default=0, nullable=False)
+    skipped_unpriced = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+
+
+ACTIVE_BILLING_RUN_STATUSES = (BillingRunStatus.queued, BillingRunStatus.running)
+_run_is_active = BillingRun.status.in_(ACTIVE_BILLING_RUN_STATUSES)
+# Every active run indexes the same value, so the database admits at most one
+# across all processes sharing it.
+Index(
+    "uq_billing_runs_one_active",
+    _run_is_active,
+    unique=True,
+    sqlite_where=_run_is_active,
+    postgresql_where=_run_is_active,
+)
+
+
+@event.listens_for(BillingSession, "before_flush")
+def _bump_invoice_revisions(session: Session, flush_context, instances) -> None:
+    # session.new/deleted rebuild an IdentitySet on every access.
+    new, deleted = session.new, session.deleted
+    touched = set()
+    for obj in (*new, *session.dirty, *deleted):
+        if isinstance(obj, Invoice):
+            if obj not in deleted and (
+                obj in new or session.is_modified(obj, include_collections=False)
+            ):
+                touched.add(obj)
+        elif isinstance(obj, (LineItem, PaymentRecord)):
+            invoice = obj.invoice
+            if invoice is None and obj.invoice_id is not None:
+                invoice = session.get(Invoice, obj.invoice_id)
+            if invoice is not None and invoice not in deleted:
+                touched.add(invoice)
+    for invoice in touched:
+        if invoice not in new:
+            # Evaluated by the UPDATE, so concurrent writers each get their bump.
+            invoice.revision = Invoice.revision + 1
@@ -0,0 +1,84 @@
+"""Exact invoice arithmetic in integer cents.
+
+Stored amounts are floats (line items, payments) or ``Numeric(10,2)``
+(invoice totals). Everything is converted to integer cents at the boundary,
+rates are applied with ``Decimal`` and rounded half-up to a whole cent, and
+only the final cents are turned back into a storable value.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, Optional, Tuple
+
+CENT = Decimal("0.01")
+
+
+def to_cents(amount) -> int:
+    """Dollars (float, Decimal, str or None) to integer cents, rounding half-up."""
+    if amount is None:
+        return 0
+    return int(_decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def to_decimal(cents: int) -> Decimal:
+    """Cents to a two-place ``Decimal`` for ``Numeric`` columns."""
+    return Decimal(cents).scaleb(-2).quantize(CENT)
+
+
+def to_float(cents: int) -> float:
+    return cents / 100
+
+
+def apply_rate(cents: int, rate: Optional[float]) -> int:
+    """``cents * rate`` rounded half-up to a whole cent."""
+    if not rate:
+        return 0
+    return int((Decimal(cents) * _decimal(rate)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def line_cents(quantity: Optional[float], unit_price: Optional[float]) -> int:
+    """Pre-tax amount of a line: quantity times the unit price in cents."""
+    amount = _decimal(quantity or 0) * to_cents(unit_price)
+    return int(amount.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+@dataclass(frozen=True)
+class InvoiceTotals:
+    subtotal: int
+    line_tax: int
+    tax: int
+    discount: int
+
+    @property
+    def total(self) -> int:
+        return self.subtotal + self.line_tax + self.tax - self.discount
+
+
+def invoice_totals(
+    lines: Iterable[Tuple[Optional[float], Optional[float], Optional[float]]],
+    tax_rate: Optional[float],
+    discount_rate: Optional[float],
+) -> InvoiceTotals:
+    """Totals for ``(quantity, unit_price, tax_rate)`` lines.
+
+    Each line's own tax is rounded per line; the invoice-level tax and
+    discount apply to the pre-tax subtotal.
+    """
+    subtotal = line_tax = 0
+    for quantity, unit_price, rate in lines:
+        base = line_cents(quantity, unit_price)
+        subtotal += base
+        line_tax += apply_rate(base, rate)
+    return InvoiceTotals(
+        subtotal=subtotal,
+        line_tax=line_tax,
+        tax=apply_rate(subtotal, tax_rate),
+        discount=apply_rate(subtotal, discount_rate),
+    )
+
+
+def _decimal(value) -> Decimal:
+    # str() keeps floats at their shortest repr (0.1 -> "0.1", not 0.1000000000000000055...).
+    return value if isinstance(value, Decimal) else Decimal(str(value))
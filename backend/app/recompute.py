@@ -0,0 +1,131 @@
+"""Batch recomputation of stored invoice totals.
+
+Run after correcting tax or discount rates::
+
+    python -m backend.app.recompute --batch-size 500
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import Numeric, bindparam, select, type_coerce, update
+from sqlalchemy.orm import Session
+
+from . import models, money
+from .database import SessionLocal
+
+BATCH_SIZE = 500
+
+
+def _exact(column):
+    # Float columns come back from SQLite as doubles; read them as Decimal so
+    # no arithmetic below ever touches a float.
+    return type_coerce(column, Numeric(asdecimal=True)).label(column.key)
+
+
+_invoices = models.Invoice.__table__
+# Core rather than ORM: an ORM bulk UPDATE takes only literal per-row values.
+_UPDATE_TOTALS = (
+    update(_invoices)
+    .where(_invoices.c.id == bindparam("invoice_id"))
+    .values(
+        subtotal=bindparam("new_subtotal"),
+        total=bindparam("new_total"),
+        # Computed in SQL so a concurrent edit's bump is never overwritten.
+        revision=_invoices.c.revision + 1,
+    )
+)
+
+
+@dataclass
+class RecomputeResult:
+    scanned: int = 0
+    updated: int = 0
+
+
+def recompute_invoice_totals(
+    session_factory: Callable[[], Session] = SessionLocal,
+    batch_size: int = BATCH_SIZE,
+    dry_run: bool = False,
+) -> RecomputeResult:
+    """Recompute every invoice's subtotal and total from its line items.
+
+    Invoices are walked in id order, one batch at a time. Each batch costs
+    two SELECTs (invoices, then their line items by indexed invoice id) and
+    one executemany UPDATE for the invoices whose stored totals changed.
+    Changed invoices get a new revision so cached documents are re-rendered.
+    """
+    result = RecomputeResult()
+    last_id = 0
+    while True:
+        with session_factory() as db:
+            invoices = db.execute(
+                select(
+                    models.Invoice.id,
+                    _exact(models.Invoice.tax_rate),
+                    _exact(models.Invoice.discount_rate),
+                    models.Invoice.subtotal,
+                    models.Invoice.total,
+                )
+                .where(models.Invoice.id > last_id)
+                .order_by(models.Invoice.id)
+                .limit(batch_size)
+            ).all()
+            if not invoices:
+                return result
+
+            lines = defaultdict(list)
+            for invoice_id, quantity, unit_price, tax_rate in db.execute(
+                select(
+                    models.LineItem.invoice_id,
+                    _exact(models.LineItem.quantity),
+                    _exact(models.LineItem.unit_price),
+                    _exact(models.LineItem.tax_rate),
+                ).where(models.LineItem.invoice_id.between(invoices[0].id, invoices[-1].id))
+            ):
+                lines[invoice_id].append((quantity, unit_price, tax_rate))
+
+            changes = []
+            for invoice in invoices:
+                totals = money.invoice_totals(
+                    lines.get(invoice.id, ()), invoice.tax_rate, invoice.discount_rate
+                )
+                if (totals.subtotal, totals.total) != (
+                    money.to_cents(invoice.subtotal),
+                    money.to_cents(invoice.total),
+                ):
+                    changes.append(
+                        {
+                            "invoice_id": invoice.id,
+                            "new_subtotal": money.to_decimal(totals.subtotal),
+                            "new_total": money.to_decimal(totals.total),
+                        }
+                    )
+
+            if changes and not dry_run:
+                db.execute(_UPDATE_TOTALS, changes)
+                db.commit()
+            result.scanned += len(invoices)
+            result.updated += len(changes)
+            last_id = invoices[-1].id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="report how many invoices would change"
+    )
+    args = parser.parse_args()
+
+    result = recompute_invoice_totals(batch_size=args.batch_size, dry_run=args.dry_run)
+    verb = "would update" if args.dry_run else "updated"
+    print(f"scanned {result.scanned} invoices, {verb} {result.updated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Bank statement CSV import that reconciles payments against open invoices."""
+
+from __future__ import annotations
+
+import csv
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import IO, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models, money
+from .ledger import OPEN_STATUSES, _paid_per_invoice
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit.
+LOOKUP_CHUNK_SIZE = 500
+INVOICE_REFERENCE = re.compile(r"(?:INV[-#\s]*)?(\d+)", re.IGNORECASE)
+
+
+@dataclass
+class BankRow:
+    line: int
+    reference: str
+    paid_on: Optional[date]
+    amount_cents: Optional[int]
+    payer: Optional[str]
+    method: Optional[str]
+    # Set when the row itself is malformed; such rows are reported, never matched.
+    error: Optional[str] = None
+
+
+@dataclass
+class OpenInvoice:
+    id: int
+    farmer_name: str
+    outstanding_cents: int
+
+
+@dataclass
+class ReconciliationReport:
+    rows: int = 0
+    matched: int = 0
+    applied_cents: int = 0
+    invoices_updated: int = 0
+    unmatched: List[dict] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "matched": self.matched,
+            "applied_total": self.applied_cents / 100,
+            "invoices_updated": self.invoices_updated,
+            "unmatched": self.unmatched,
+        }
+
+
+def read_bank_rows(stream: IO[str]) -> Iterator[BankRow]:
+    """Parse a bank export row by row; expects ``reference`` and ``amount`` columns."""
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames or ()
+        missing = {"reference", "amount"} - {name.strip().lower() for name in fieldnames}
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+
+        for line, raw in enumerate(reader, start=2):
+            # DictReader files surplus fields under the key None as a list.
+            extra = raw.pop(None, None)
+            row = {
+                key.strip().lower(): (value or "").strip()
+                for key, value in raw.items()
+                if key is not None
+            }
+            yield BankRow(
+                line=line,
+                reference=row["reference"],
+                paid_on=_to_date(row.get("date")),
+                amount_cents=_parse_cents(row["amount"]),
+                payer=row.get("payer") or None,
+                method=row.get("method") or "bank transfer",
+                error="more fields than the header" if extra else None,
+            )
+    except csv.Error as exc:
+        raise ValueError(f"Malformed CSV near line {reader.line_num}: {exc}") from exc
+
+
+def reconcile(db: Session, rows: Iterable[BankRow]) -> ReconciliationReport:
+    """Apply every matching row as a payment and commit them in one transaction.
+
+    Rows are matched by the invoice number in their reference; rows without
+    one fall back to the payer's open invoice with exactly that outstanding
+    amount. Rows are consumed in chunks of ``LOOKUP_CHUNK_SIZE``. Each chunk
+    costs a handful of batched, indexed lookups for the invoices, payers and
+    references it introduces. Its payments are inserted before the next chunk
+    is read, so the upload is never held in memory as a whole.
+    """
+    report = ReconciliationReport()
+    state = _MatchState()
+    outstanding_after: Dict[int, int] = {}
+    try:
+        rows = iter(rows)
+        while chunk := list(islice(rows, LOOKUP_CHUNK_SIZE)):
+            report.rows += len(chunk)
+            state.load(db, chunk)
+            payments = []
+            for row in chunk:
+                invoice, reason = state.match(row)
+                if reason is not None:
+                    report.unmatched.append(
+                        {
+                            "line": row.line,
+                            "reference": row.reference,
+                            "amount": None if row.amount_cents is None else row.amount_cents / 100,
+                            "payer": row.payer,
+                            "reason": reason,
+                        }
+                    )
+                    continue
+                invoice.outstanding_cents -= row.amount_cents
+                outstanding_after[invoice.id] = invoice.outstanding_cents
+                payments.append((invoice.id, row))
+                report.matched += 1
+                report.applied_cents += row.amount_cents
+            _insert_payments(db, payments)
+        _update_statuses(db, outstanding_after)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    report.invoices_updated = len(outstanding_after)
+    return report
+
+
+class _MatchState:
+    """Invoices, payer candidates and imported payment keys seen so far in one file."""
+
+    def __init__(self) -> None:
+        self.invoices: Dict[int, OpenInvoice] = {}
+        self.by_payer: Dict[tuple, List[OpenInvoice]] = defaultdict(list)
+        self.imported: set = set()
+        self._invoice_ids: set = set()
+        self._payers: set = set()
+        self._references: set = set()
+
+    def load(self, db: Session, rows: List[BankRow]) -> None:
+        references = {row.reference for row in rows if row.reference} - self._references
+        self._references |= references
+        self.imported |= _existing_payments(db, references)
+
+        invoice_ids = {_invoice_id(row.reference) for row in rows} - {None} - self._invoice_ids
+        self._invoice_ids |= invoice_ids
+        for invoice in _open_invoices(db, models.Invoice.id.in_, invoice_ids).values():
+            self.invoices.setdefault(invoice.id, invoice)
+
+        payers = {
+            row.payer.lower() for row in rows if row.payer and _invoice_id(row.reference) is None
+        } - self._payers
+        self._payers |= payers
+        for invoice in _open_invoices(db, func.lower(models.Farmer.name).in_, payers).values():
+            invoice = self.invoices.setdefault(invoice.id, invoice)
+            self.by_payer[(invoice.farmer_name.lower(), invoice.outstanding_cents)].append(invoice)
+
+    def match(self, row: BankRow):
+        if row.error:
+            return None, row.error
+        key = (row.reference, row.paid_on, row.amount_cents)
+        if row.reference and key in self.imported:
+            return None, "duplicate payment"
+        invoice, reason = _match(row, self.invoices, self.by_payer)
+        if reason is None:
+            self.imported.add(key)
+        return invoice, reason
+
+
+def _match(row: BankRow, by_id: dict, by_payer: dict):
+    if row.amount_cents is None or row.amount_cents <= 0:
+        return None, "invalid amount"
+
+    invoice_id = _invoice_id(row.reference)
+    if invoice_id is None:
+        if not row.payer:
+            return None, "no invoice reference or payer"
+        candidates = [
+            invoice
+            for invoice in by_payer.get((row.payer.lower(), row.amount_cents), ())
+            if invoice.outstanding_cents == row.amount_cents
+        ]
+        if len(candidates) != 1:
+            return None, "no unique open invoice for payer and amount"
+        return candidates[0], None
+
+    invoice = by_id.get(invoice_id)
+    if invoice is None:
+        return None, "no open invoice for reference"
+    if row.payer and row.payer.lower() != invoice.farmer_name.lower():
+        return None, "payer does not match invoice farmer"
+    if row.amount_cents > invoice.outstanding_cents:
+        return None, "amount exceeds outstanding balance"
+    return invoice, None
+
+
+def _update_statuses(db: Session, outstanding_after: Dict[int, int]) -> None:
+    """Mark the paid invoices paid and the rest partial with bulk statements.
+
+    Like the overdue sweeper, this bypasses the unit of work, so it bumps
+    ``Invoice.revision`` itself to invalidate cached documents.
+    """
+    by_status = defaultdict(list)
+    for invoice_id, outstanding in outstanding_after.items():
+        paid_off = outstanding <= 0
+        by_status[models.InvoiceStatus.paid if paid_off else models.InvoiceStatus.partial].append(
+            invoice_id
+        )
+    for status, invoice_ids in by_status.items():
+        for start in range(0, len(invoice_ids), LOOKUP_CHUNK_SIZE):
+            db.execute(
+                update(models.Invoice)
+                .where(models.Invoice.id.in_(invoice_ids[start : start + LOOKUP_CHUNK_SIZE]))
+                .values(status=status, revision=models.Invoice.revision + 1)
+                .execution_options(synchronize_session=False)
+            )
+
+
+def _insert_payments(db: Session, payments: List[tuple]) -> None:
+    if not payments:
+        return
+    db.execute(
+        insert(models.PaymentRecord),
+        [
+            {
+                "invoice_id": invoice_id,
+                "amount": money.to_float(row.amount_cents),
+                "method": row.method,
+                "reference": row.reference,
+                "date": datetime.combine(row.paid_on, datetime.min.time())
+                if row.paid_on
+                else datetime.utcnow(),
+                "notes": f"Bank import line {row.line}",
+            }
+            for invoice_id, row in payments
+        ],
+    )
+
+
+def _open_invoices(db: Session, column_in, keys) -> Dict[int, OpenInvoice]:
+    paid = _paid_per_invoice()
+    query = (
+        select(
+            models.Invoice.id,
+            models.Farmer.name,
+            models.Invoice.total,
+            func.coalesce(paid.c.paid, 0).label("paid"),
+        )
+        .join(models.Farmer, models.Farmer.id == models.Invoice.farmer_id)
+        .outerjoin(paid, paid.c.invoice_id == models.Invoice.id)
+        .where(models.Invoice.status.in_(OPEN_STATUSES))
+    )
+    return {
+        row.id: OpenInvoice(
+            id=row.id,
+            farmer_name=row.name,
+            outstanding_cents=money.to_cents(row.total) - money.to_cents(row.paid),
+        )
+        for row in _chunked_query(db, query, column_in, keys, scalars=False)
+    }
+
+
+def _existing_payments(db: Session, references) -> set:
+    """Keys of payments already recorded under these references.
+
+    A key is (reference, day, cents); rows without a date match on
+    (reference, None, cents), so re-importing the same file is a no-op while
+    two different instalments against one invoice number still apply.
+    """
+    query = select(
+        models.PaymentRecord.reference, models.PaymentRecord.date, models.PaymentRecord.amount
+    )
+    keys = set()
+    for reference, paid_at, amount in _chunked_query(
+        db, query, models.PaymentRecord.reference.in_, references, scalars=False
+    ):
+        cents = money.to_cents(amount)
+        keys.update({(reference, paid_at.date(), cents), (reference, None, cents)})
+    return keys
+
+
+def _chunked_query(db: Session, query, column_in, keys, scalars: bool = True):
+    keys = list(keys)
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        result = db.execute(query.where(column_in(keys[start : start + LOOKUP_CHUNK_SIZE])))
+        yield from (result.scalars() if scalars else result)
+
+
+def _invoice_id(reference: str) -> Optional[int]:
+    match = INVOICE_REFERENCE.fullmatch(reference or "")
+    return int(match.group(1)) if match else None
+
+
+def _parse_cents(value: str) -> Optional[int]:
+    """Cents for a statement amount such as ``"$1,234.50"``; None unless finite."""
+    try:
+        amount = Decimal(value.replace(",", "").replace("$", ""))
+        # Non-finite or absurdly large amounts fail to quantize as well.
+        return money.to_cents(amount) if amount.is_finite() else None
+    except InvalidOperation:
+        return None
+
+
+def _to_date(value: Optional[str]) -> Optional[date]:
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,240 @@
+"""Invoice documents: revision-keyed cache, HTML templates and off-process PDFs."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import zipfile
+from collections.abc import AsyncIterator, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from fpdf import FPDF
+from jinja2 import Environment, FileSystemLoader, Template
+
+from . import models
+
+RENDER_CACHE_DIR = Path(os.getenv("INVOICE_RENDER_CACHE_DIR", "./.cache/invoices"))
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+TEMPLATE_NAMES = ("invoice.html", "statement.html")
+# Renders a ZIP export keeps in flight; bounds memory to a few documents.
+EXPORT_MAX_IN_FLIGHT = PDF_RENDER_WORKERS * 2
+
+
+class InvoiceRenderCache:
+    """Rendered invoice documents on disk, one file per invoice revision.
+
+    Any write to an invoice, its line items or its payments bumps
+    ``Invoice.revision``, so a stale document is simply never looked up again;
+    ``put`` removes older revisions of the same invoice.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+
+    def path(self, invoice_id: int, revision: int, extension: str) -> Path:
+        return self.directory / f"invoice-{invoice_id}-r{revision}.{extension}"
+
+    def get(self, invoice_id: int, revision: int, extension: str) -> Optional[Path]:
+        path = self.path(invoice_id, revision, extension)
+        return path if path.exists() else None
+
+    def put(self, invoice_id: int, revision: int, extension: str, content: bytes) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        target = self.path(invoice_id, revision, extension)
+        # Write then rename so concurrent readers never see a partial file.
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(content)
+        os.replace(tmp_name, target)
+        for stale in self.directory.glob(f"invoice-{invoice_id}-r*.{extension}"):
+            if stale != target:
+                stale.unlink(missing_ok=True)
+        return target
+
+
+def invoice_snapshot(invoice: models.Invoice) -> dict:
+    """Plain, picklable view of an invoice for rendering in another process."""
+    return {
+        "id": invoice.id,
+        "revision": invoice.revision,
+        "status": invoice.status.value,
+        "farmer_name": invoice.farmer.name,
+        "farmer_email": invoice.farmer.email,
+        "field_name": invoice.field.name if invoice.field else None,
+        "issue_date": invoice.issue_date.isoformat(),
+        "due_date": invoice.due_date.isoformat() if invoice.due_date else None,
+        "subtotal": float(invoice.subtotal or 0),
+        "tax_rate": invoice.tax_rate or 0.0,
+        "discount_rate": invoice.discount_rate or 0.0,
+        "total": float(invoice.total or 0),
+        "outstanding": invoice.outstanding_balance(),
+        "notes": invoice.notes,
+        "line_items": [
+            {
+                "description": item.description,
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "line_total": item.line_total(),
+            }
+            for item in invoice.line_items
+        ],
+        "payments": [
+            {
+                "date": payment.date.date().isoformat(),
+                "amount": payment.amount,
+                "method": payment.method,
+            }
+            for payment in invoice.payments
+        ],
+    }
+
+
+_environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True, auto_reload=False
+)
+_environment.filters["money"] = lambda value: f"${value:.2f}"
+_environment.filters["percent"] = lambda value: f"{value * 100:.1f}%"
+_templates: dict[str, Template] = {}
+
+
+def compile_templates() -> None:
+    """Compile every template up front so requests only ever render."""
+    for name in TEMPLATE_NAMES:
+        _templates[name] = _environment.get_template(name)
+
+
+def _template(name: str) -> Template:
+    if name not in _templates:
+        compile_templates()
+    return _templates[name]
+
+
+def render_invoice_html(snapshot: dict) -> str:
+    return _template("invoice.html").render(invoice=snapshot)
+
+
+def render_statement_html(farmer: models.Farmer, snapshots: list[dict], as_of: str) -> str:
+    return _template("statement.html").render(
+        farmer=farmer,
+        invoices=snapshots,
+        outstanding=sum(snapshot["outstanding"] for snapshot in snapshots),
+        as_of=as_of,
+    )
+
+
+def render_invoice_pdf(snapshot: dict) -> bytes:
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("helvetica", "B", 16)
+    pdf.cell(40, 10, f"Invoice #{snapshot['id']}")
+    pdf.ln(12)
+    pdf.set_font("helvetica", size=12)
+    pdf.cell(0, 10, f"Farmer: {snapshot['farmer_name']}", ln=True)
+    pdf.cell(0, 10, f"Field: {snapshot['field_name'] or 'N/A'}", ln=True)
+    pdf.cell(0, 10, f"Status: {snapshot['status']}", ln=True)
+
+    pdf.ln(5)
+    for item in snapshot["line_items"]:
+        pdf.cell(
+            0,
+            8,
+            f"- {item['description']} ({item['quantity']} @ ${item['unit_price']:.2f})",
+            ln=True,
+        )
+    pdf.ln(3)
+    pdf.cell(0, 8, f"Subtotal: ${snapshot['subtotal']:.2f}", ln=True)
+    pdf.cell(
+        0,
+        8,
+        f"Tax: {snapshot['tax_rate'] * 100:.1f}% | "
+        f"Discount: {snapshot['discount_rate'] * 100:.1f}%",
+        ln=True,
+    )
+    pdf.cell(0, 8, f"Total Due: ${snapshot['total']:.2f}", ln=True)
+    return bytes(pdf.output())
+
+
+render_cache = InvoiceRenderCache(RENDER_CACHE_DIR)
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+
+def pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS)
+    return _pdf_executor
+
+
+def shutdown_pdf_executor() -> None:
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
+        _pdf_executor = None
+
+
+async def cached_pdf(snapshot: dict) -> Path:
+    """Return the cached PDF for this revision, rendering it in the pool on a miss."""
+    invoice_id, revision = snapshot["id"], snapshot["revision"]
+    path = render_cache.get(invoice_id, revision, "pdf")
+    if path is not None:
+        return path
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(pdf_executor(), render_invoice_pdf, snapshot)
+    return await run_in_threadpool(render_cache.put, invoice_id, revision, "pdf", content)
+
+
+class _ZipSink:
+    """Write-only file object that collects ZIP output until it is drained.
+
+    It has no ``tell``/``seek``, so :class:`zipfile.ZipFile` writes data
+    descriptors and never goes back to patch earlier bytes.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        chunk = b"".join(self._chunks)
+        self._chunks.clear()
+        return chunk
+
+
+async def pdf_zip_chunks(snapshots: Iterable[dict]) -> AsyncIterator[bytes]:
+    """Stream a ZIP of invoice PDFs, adding each one as soon as it is ready."""
+    pending_snapshots = iter(snapshots)
+    in_flight: dict[asyncio.Task, int] = {}
+
+    def schedule() -> None:
+        for snapshot in pending_snapshots:
+            in_flight[asyncio.ensure_future(cached_pdf(snapshot))] = snapshot["id"]
+            if len(in_flight) >= EXPORT_MAX_IN_FLIGHT:
+                return
+
+    sink = _ZipSink()
+    try:
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            schedule()
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                finished = [(in_flight.pop(task), task.result()) for task in done]
+                schedule()
+                for invoice_id, path in finished:
+                    content = await run_in_threadpool(path.read_bytes)
+                    archive.writestr(f"invoice-{invoice_id}.pdf", content)
+                    yield sink.drain()
+        yield sink.drain()
+    finally:
+        for task in in_flight:
+            task.cancel()
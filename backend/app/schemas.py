@@ -1,12 +1,12 @@
 from __future__ import annotations
 
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, validator
 from pydantic import Field as PydanticField
 
-from .models import InvoiceStatus
+from .models import BillingRunStatus, InvoiceStatus
 
 
 class FarmerCreate(BaseModel):
@@ -51,10 +51,17 @@ class LineItemCreate(LineItemBase):
     pass
 
 
+def _call_if_method(value):
+    # orm_mode reads ``line_total``/``outstanding_balance`` as bound methods.
+    return value() if callable(value) else value
+
+
 class LineItemOut(LineItemBase):
     id: int
     line_total: float = PydanticField(..., alias="line_total")
 
+    _resolve_line_total = validator("line_total", pre=True, allow_reuse=True)(_call_if_method)
+
     class Config:
         orm_mode = True
         allow_population_by_field_name = True
@@ -108,6 +115,103 @@ class InvoiceOut(BaseModel):
     payments: List[PaymentOut]
     outstanding_balance: float = PydanticField(..., alias="outstanding_balance")
 
+    _resolve_outstanding_balance = validator(
+        "outstanding_balance", pre=True, allow_reuse=True
+    )(_call_if_method)
+
     class Config:
         orm_mode = True
         allow_population_by_field_name = True
+
+
+class FarmerBalanceOut(BaseModel):
+    farmer_id: int
+    name: str
+    billed: float
+    paid: float
+    outstanding_balance: float
+
+
+class AgingRowOut(BaseModel):
+    farmer_id: int
+    name: str
+    days_0_30: float
+    days_31_60: float
+    days_61_90: float
+    days_over_90: float
+    total: float
+
+
+class InvoiceStatusStatOut(BaseModel):
+    status: InvoiceStatus
+    count: int
+    total: float
+
+
+class InvoiceMonthStatOut(BaseModel):
+    month: str
+    count: int
+    total: float
+
+
+class InvoiceStatsOut(BaseModel):
+    count: int
+    total: float
+    by_status: List[InvoiceStatusStatOut]
+    by_month: List[InvoiceMonthStatOut]
+
+
+class UnmatchedBankRowOut(BaseModel):
+    line: int
+    reference: str
+    amount: Optional[float]
+    payer: Optional[str]
+    reason: str
+
+
+class ReconciliationReportOut(BaseModel):
+    rows: int
+    matched: int
+    applied_total: float
+    invoices_updated: int
+    unmatched: List[UnmatchedBankRowOut]
+
+
+class FieldApplicationCreate(BaseModel):
+    field_id: int
+    product: str
+    quantity: float = 1.0
+    applied_on: date
+    notes: Optional[str] = None
+
+
+class FieldApplicationOut(FieldApplicationCreate):
+    id: int
+
+    class Config:
+        orm_mode = True
+
+
+class BillingRunCreate(BaseModel):
+    start_date: date
+    end_date: date
+    group_by: Literal["farmer", "field"] = "farmer"
+    prices: Dict[str, float]
+    due_in_days: int = 30
+
+
+class BillingRunOut(BaseModel):
+    id: int
+    status: BillingRunStatus
+    period_start: date
+    period_end: date
+    group_by: str
+    created_at: datetime
+    finished_at: Optional[datetime]
+    invoices_created: int
+    line_items_created: int
+    skipped_unpriced: int
+    error: Optional[str]
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,85 @@
+"""Background sweeper that moves past-due invoices to overdue."""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import date
+from typing import Callable, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+SWEEP_INTERVAL_SECONDS = float(os.getenv("OVERDUE_SWEEP_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
+
+
+def mark_overdue_invoices(db: Session, today: Optional[date] = None) -> int:
+    """Flag every sent invoice past its due date with a single UPDATE."""
+    result = db.execute(
+        update(models.Invoice)
+        .where(
+            models.Invoice.status == models.InvoiceStatus.sent,
+            models.Invoice.due_date.is_not(None),
+            models.Invoice.due_date < (today or date.today()),
+        )
+        .values(
+            status=models.InvoiceStatus.overdue, revision=models.Invoice.revision + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+class OverdueSweeper:
+    """Runs :func:`mark_overdue_invoices` on a daemon thread at a fixed interval."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval: float = SWEEP_INTERVAL_SECONDS,
+    ) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="overdue-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def sweep(self) -> int:
+        db = self.session_factory()
+        try:
+            return mark_overdue_invoices(db)
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                updated = self.sweep()
+                if updated:
+                    logger.info("Marked %d invoices overdue", updated)
+            except Exception:
+                logger.exception("Overdue sweep failed")
+            if self._stop.wait(self.interval):
+                return
+
+
+overdue_sweeper = OverdueSweeper()
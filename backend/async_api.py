@@ -0,0 +1,113 @@
+"""Async variants of the field and event handlers backed by aiosqlite."""
+
+from datetime import date
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .database import get_async_session
+from .dependencies import require_role
+from .models import (
+    ApplicationEvent,
+    ApplicationEventCreate,
+    ApplicationEventRead,
+    ApplicationEventSummary,
+    Field,
+    FieldCreate,
+    FieldRead,
+)
+from .queries import filter_events, summarize_rows
+
+router = APIRouter()
+
+
+async def _get_field_or_404(session: AsyncSession, field_id: int) -> Field:
+    field = await session.get(Field, field_id)
+    if not field:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Field not found")
+    return field
+
+
+@router.post(
+    "/fields",
+    response_model=FieldRead,
+    dependencies=[Depends(require_role(["admin", "manager"]))],
+)
+async def create_field(
+    field: FieldCreate, session: Annotated[AsyncSession, Depends(get_async_session)]
+) -> Field:
+    new_field = Field.from_orm(field)
+    session.add(new_field)
+    await session.commit()
+    await session.refresh(new_field)
+    return new_field
+
+
+@router.get("/fields", response_model=list[FieldRead])
+async def list_fields(
+    session: Annotated[AsyncSession, Depends(get_async_session)]
+) -> list[Field]:
+    return (await session.exec(select(Field))).all()
+
+
+@router.post(
+    "/fields/{field_id}/events",
+    response_model=ApplicationEventRead,
+    dependencies=[Depends(require_role(["admin", "manager"]))],
+)
+async def add_event(
+    field_id: int,
+    event: ApplicationEventCreate,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> ApplicationEvent:
+    field = await _get_field_or_404(session, field_id)
+
+    payload = event.dict()
+    payload["field_id"] = field_id
+    db_event = ApplicationEvent(**payload)
+    session.add(db_event)
+    # Incremented in SQL so concurrent adds each bump the revision.
+    field.event_revision = Field.event_revision + 1
+    await session.commit()
+    await session.refresh(db_event)
+    return db_event
+
+
+@router.get("/fields/{field_id}/events", response_model=list[ApplicationEventRead])
+async def list_events(
+    field_id: int,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product: Optional[str] = None,
+    operator: Optional[str] = None,
+) -> list[ApplicationEvent]:
+    await _get_field_or_404(session, field_id)
+
+    query = select(ApplicationEvent).where(ApplicationEvent.field_id == field_id)
+    query = filter_events(query, start_date, end_date, product, operator)
+
+    return (await session.exec(query.order_by(ApplicationEvent.date))).all()
+
+
+@router.get(
+    "/fields/{field_id}/events/summary", response_model=list[ApplicationEventSummary]
+)
+async def summarize_events(
+    field_id: int, session: Annotated[AsyncSession, Depends(get_async_session)]
+) -> list[ApplicationEventSummary]:
+    await _get_field_or_404(session, field_id)
+
+    query = (
+        select(
+            ApplicationEvent.date,
+            ApplicationEvent.product,
+            ApplicationEvent.rate,
+        )
+        .where(ApplicationEvent.field_id == field_id)
+        .order_by(ApplicationEvent.date)
+    )
+
+    return summarize_rows((await session.exec(query)).all())
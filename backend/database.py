@@ -1,14 +1,39 @@
-from sqlmodel import Session, SQLModel, create_engine
+import os
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from fieldflux.db import create_async_sqlite_engine, create_sqlite_engine, migrate_schema
 
 DATABASE_URL = "sqlite:///./data.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./data.db"
+# "sync" serves field/event handlers from the threadpool; "async" uses aiosqlite.
+DB_MODE = os.getenv("FIELDFLUX_DB_MODE", "sync")
 
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_sqlite_engine(DATABASE_URL, name="events")
+# Built on first use so sync-mode deployments never start an aiosqlite engine.
+_async_engine: Optional[AsyncEngine] = None
 
 
 def create_db_and_tables() -> None:
-    SQLModel.metadata.create_all(engine)
+    # Also adds columns introduced since the database was created (field.event_revision).
+    migrate_schema(engine, SQLModel.metadata)
 
 
 def get_session() -> Session:
     with Session(engine) as session:
         yield session
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_sqlite_engine(ASYNC_DATABASE_URL, name="events")
+    return _async_engine
+
+
+async def get_async_session() -> AsyncSession:
+    async with AsyncSession(get_async_engine()) as session:
+        yield session
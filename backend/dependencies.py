@@ -0,0 +1,14 @@
+from typing import Annotated, Optional
+
+from fastapi import Header, HTTPException, status
+
+
+def require_role(allowed_roles: list[str]):
+    def verifier(role: Annotated[Optional[str], Header(alias="X-Role")] = None):
+        if role not in allowed_roles:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Insufficient role for this action",
+            )
+
+    return verifier
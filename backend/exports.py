@@ -0,0 +1,81 @@
+"""Streaming serializers for bulk application event exports."""
+
+import csv
+import io
+import json
+from collections.abc import Iterable, Iterator
+from datetime import date
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+EXPORT_COLUMNS = (
+    "id",
+    "field_id",
+    "field_name",
+    "date",
+    "product",
+    "rate",
+    "operator",
+    "notes",
+)
+
+# Rows fetched per round trip from the server-side cursor.
+YIELD_PER = 500
+# Bytes buffered before a chunk is handed to the response.
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_rows(engine: Engine, query) -> Iterator[tuple]:
+    """Yield result rows in batches without materializing the full result.
+
+    The export owns its session because the request-scoped session is closed
+    before a streaming response starts sending its body.
+    """
+    with Session(engine) as session:
+        result = session.exec(query.execution_options(yield_per=YIELD_PER))
+        yield from result
+
+
+def csv_chunks(rows: Iterable[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    # Send the header before the query runs so clients see bytes right away.
+    yield _drain(buffer)
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield _drain(buffer)
+
+    if buffer.tell():
+        yield _drain(buffer)
+
+
+def ndjson_chunks(rows: Iterable[tuple]) -> Iterator[str]:
+    lines: list[str] = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(EXPORT_COLUMNS, row, strict=True)), default=_json_default)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines, size = [], 0
+
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _drain(buffer: io.StringIO) -> str:
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
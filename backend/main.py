@@ -1,10 +1,18 @@
 from datetime import date
 from typing import Annotated, Optional
 
-from fastapi import Depends, FastAPI, Header, HTTPException, status
-from sqlmodel import Session, col, select
-
-from .database import create_db_and_tables, get_session
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlmodel import Session, col, func, select
+
+from fieldflux.instrumentation import instrument_app
+
+from .analytics import seasonal_comparison_cache
+from .async_api import router as async_events_router
+from .database import DB_MODE, create_db_and_tables, get_session
+from .dependencies import require_role
+from .exports import csv_chunks, ndjson_chunks, stream_rows
 from .models import (
     ApplicationEvent,
     ApplicationEventCreate,
@@ -13,9 +21,18 @@ from .models import (
     Field,
     FieldCreate,
     FieldRead,
+    SeasonalComparisonRow,
 )
+from .queries import filter_events, summarize_rows
 
 app = FastAPI(title="FieldFlux API")
+instrument_app(app, "events")
+# Field and event CRUD handlers; swapped for async_events_router when DB_MODE is "async".
+events_router = APIRouter()
+
+REPORT_CACHE_SIZE = 1024
+# field_id -> (event_revision, rendered report); stale entries are replaced on read.
+_report_cache: dict[int, tuple[int, dict]] = {}
 
 
 @app.on_event("startup")
@@ -23,18 +40,7 @@ def on_startup() -> None:
     create_db_and_tables()
 
 
-def require_role(allowed_roles: list[str]):
-    def verifier(role: Annotated[Optional[str], Header(None, alias="X-Role")]):
-        if role not in allowed_roles:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Insufficient role for this action",
-            )
-
-    return verifier
-
-
-@app.post(
+@events_router.post(
     "/fields",
     response_model=FieldRead,
     dependencies=[Depends(require_role(["admin", "manager"]))],
@@ -49,12 +55,12 @@ def create_field(
     return new_field
 
 
-@app.get("/fields", response_model=list[FieldRead])
+@events_router.get("/fields", response_model=list[FieldRead])
 def list_fields(session: Annotated[Session, Depends(get_session)]) -> list[Field]:
     return session.exec(select(Field)).all()
 
 
-@app.post(
+@events_router.post(
     "/fields/{field_id}/events",
     response_model=ApplicationEventRead,
     dependencies=[Depends(require_role(["admin", "manager"]))],
@@ -72,12 +78,14 @@ def add_event(
     payload["field_id"] = field_id
     db_event = ApplicationEvent(**payload)
     session.add(db_event)
+    # Incremented in SQL so concurrent adds each bump the revision.
+    field.event_revision = Field.event_revision + 1
     session.commit()
     session.refresh(db_event)
     return db_event
 
 
-@app.get("/fields/{field_id}/events", response_model=list[ApplicationEventRead])
+@events_router.get("/fields/{field_id}/events", response_model=list[ApplicationEventRead])
 def list_events(
     field_id: int,
     session: Annotated[Session, Depends(get_session)],
@@ -91,20 +99,14 @@ def list_events(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Field not found")
 
     query = select(ApplicationEvent).where(ApplicationEvent.field_id == field_id)
-
-    if start_date:
-        query = query.where(ApplicationEvent.date >= start_date)
-    if end_date:
-        query = query.where(ApplicationEvent.date <= end_date)
-    if product:
-        query = query.where(col(ApplicationEvent.product).ilike(f"%{product}%"))
-    if operator:
-        query = query.where(col(ApplicationEvent.operator).ilike(f"%{operator}%"))
+    query = filter_events(query, start_date, end_date, product, operator)
 
     return session.exec(query.order_by(ApplicationEvent.date)).all()
 
 
-@app.get("/fields/{field_id}/events/summary", response_model=list[ApplicationEventSummary])
+@events_router.get(
+    "/fields/{field_id}/events/summary", response_model=list[ApplicationEventSummary]
+)
 def summarize_events(
     field_id: int, session: Annotated[Session, Depends(get_session)]
 ) -> list[ApplicationEventSummary]:
@@ -122,23 +124,111 @@ def summarize_events(
         .order_by(ApplicationEvent.date)
     )
 
-    rows = session.exec(query).all()
-    summaries: dict[tuple[int, str], ApplicationEventSummary] = {}
-    for event_date, product, rate in rows:
-        season = event_date.year
-        key = (season, product)
-        summary = summaries.setdefault(
-            key,
-            ApplicationEventSummary(season=season, product=product, total_rate=0.0, event_count=0),
-        )
-        summary.total_rate += rate
-        summary.event_count += 1
-
-    return list(summaries.values())
+    return summarize_rows(session.exec(query).all())
 
 
 @app.get("/reports/field/{field_id}")
 def field_report(field_id: int, session: Annotated[Session, Depends(get_session)]):
-    events = list_events(field_id=field_id, session=session)
-    summaries = summarize_events(field_id=field_id, session=session)
-    return {"events": events, "summaries": summaries}
+    revision = session.exec(select(Field.event_revision).where(Field.id == field_id)).first()
+    if revision is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Field not found")
+
+    cached = _report_cache.get(field_id)
+    if cached and cached[0] == revision:
+        return JSONResponse(content=cached[1])
+
+    events = session.exec(
+        select(ApplicationEvent)
+        .where(ApplicationEvent.field_id == field_id)
+        .order_by(ApplicationEvent.date)
+    ).all()
+    report = jsonable_encoder(
+        {
+            "events": [ApplicationEventRead.from_orm(event) for event in events],
+            "summaries": summarize_rows(
+                (event.date, event.product, event.rate) for event in events
+            ),
+        }
+    )
+
+    if len(_report_cache) >= REPORT_CACHE_SIZE and field_id not in _report_cache:
+        _report_cache.pop(next(iter(_report_cache)))
+    _report_cache[field_id] = (revision, report)
+    return JSONResponse(content=report)
+
+
+@app.get("/analytics/seasonal-comparison", response_model=list[SeasonalComparisonRow])
+def seasonal_comparison(
+    session: Annotated[Session, Depends(get_session)],
+    field_id: Optional[int] = None,
+    season: Optional[int] = None,
+    product: Optional[str] = None,
+) -> list[dict]:
+    comparison = seasonal_comparison_cache.get(session)
+    return comparison.rows(field_id=field_id, season=season, product=product)
+
+
+def _export_query(
+    session: Session,
+    field_ids: Optional[list[int]],
+    start_date: Optional[date],
+    end_date: Optional[date],
+    product: Optional[str],
+    operator: Optional[str],
+):
+    if field_ids:
+        found = session.exec(
+            select(func.count()).select_from(Field).where(col(Field.id).in_(field_ids))
+        ).one()
+        if found != len(set(field_ids)):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Field not found")
+
+    query = select(
+        ApplicationEvent.id,
+        ApplicationEvent.field_id,
+        Field.name,
+        ApplicationEvent.date,
+        ApplicationEvent.product,
+        ApplicationEvent.rate,
+        ApplicationEvent.operator,
+        ApplicationEvent.notes,
+    ).join(Field, Field.id == ApplicationEvent.field_id)
+    if field_ids:
+        query = query.where(col(ApplicationEvent.field_id).in_(field_ids))
+    query = filter_events(query, start_date, end_date, product, operator)
+    return query.order_by(ApplicationEvent.field_id, ApplicationEvent.date, ApplicationEvent.id)
+
+
+@app.get("/exports/events.csv")
+def export_events_csv(
+    session: Annotated[Session, Depends(get_session)],
+    field_id: Annotated[Optional[list[int]], Query()] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product: Optional[str] = None,
+    operator: Optional[str] = None,
+) -> StreamingResponse:
+    query = _export_query(session, field_id, start_date, end_date, product, operator)
+    rows = stream_rows(session.get_bind(), query)
+    headers = {"Content-Disposition": "attachment; filename=application-events.csv"}
+    return StreamingResponse(csv_chunks(rows), media_type="text/csv", headers=headers)
+
+
+@app.get("/exports/events.ndjson")
+def export_events_ndjson(
+    session: Annotated[Session, Depends(get_session)],
+    field_id: Annotated[Optional[list[int]], Query()] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product: Optional[str] = None,
+    operator: Optional[str] = None,
+) -> StreamingResponse:
+    query = _export_query(session, field_id, start_date, end_date, product, operator)
+    rows = stream_rows(session.get_bind(), query)
+    headers = {"Content-Disposition": "attachment; filename=application-events.ndjson"}
+    return StreamingResponse(
+        ndjson_chunks(rows), media_type="application/x-ndjson", headers=headers
+    )
+
+
+app.include_router(async_events_router if DB_MODE == "async" else events_router)
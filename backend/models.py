@@ -1,7 +1,8 @@
 from datetime import date
 from typing import Optional
 
-from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel import Field as SQLField
+from sqlmodel import Relationship, SQLModel
 
 
 class FieldBase(SQLModel):
@@ -10,7 +11,9 @@ class FieldBase(SQLModel):
 
 
 class Field(FieldBase, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+    id: Optional[int] = SQLField(default=None, primary_key=True)
+    # Bumped whenever an event is added so cached reports can detect staleness.
+    event_revision: int = SQLField(default=0)
 
     events: list["ApplicationEvent"] = Relationship(back_populates="field")
 
@@ -32,8 +35,8 @@ class ApplicationEventBase(SQLModel):
 
 
 class ApplicationEvent(ApplicationEventBase, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    field_id: int = Field(foreign_key="field.id")
+    id: Optional[int] = SQLField(default=None, primary_key=True)
+    field_id: int = SQLField(foreign_key="field.id")
 
     field: Optional[Field] = Relationship(back_populates="events")
 
@@ -52,3 +55,13 @@ class ApplicationEventSummary(SQLModel):
     product: str
     total_rate: float
     event_count: int
+
+
+class SeasonalComparisonRow(SQLModel):
+    field_id: int
+    season: int
+    product: str
+    total_rate: float
+    event_count: int
+    yoy_delta: Optional[float] = None
+    percentile_rank: float
@@ -0,0 +1,41 @@
+"""Query helpers shared by the sync and async event handlers."""
+
+from datetime import date
+from typing import Optional
+
+from sqlmodel import col
+
+from .models import ApplicationEvent, ApplicationEventSummary
+
+
+def filter_events(
+    query,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product: Optional[str] = None,
+    operator: Optional[str] = None,
+):
+    if start_date:
+        query = query.where(ApplicationEvent.date >= start_date)
+    if end_date:
+        query = query.where(ApplicationEvent.date <= end_date)
+    if product:
+        query = query.where(col(ApplicationEvent.product).ilike(f"%{product}%"))
+    if operator:
+        query = query.where(col(ApplicationEvent.operator).ilike(f"%{operator}%"))
+    return query
+
+
+def summarize_rows(rows) -> list[ApplicationEventSummary]:
+    summaries: dict[tuple[int, str], ApplicationEventSummary] = {}
+    for event_date, product, rate in rows:
+        season = event_date.year
+        key = (season, product)
+        summary = summaries.setdefault(
+            key,
+            ApplicationEventSummary(season=season, product=product, total_rate=0.0, event_count=0),
+        )
+        summary.total_rate += rate
+        summary.event_count += 1
+
+    return list(summaries.values())
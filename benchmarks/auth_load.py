@@ -0,0 +1,241 @@
+"""Load benchmark for the auth API.
+
+Drives ``/signup``, ``/login``, ``/token/refresh`` and ``/me`` in-process
+through httpx's ASGI transport, against a throwaway SQLite file. For each
+concurrency level every endpoint runs in its own phase for a fixed duration:
+
+* ``signup`` registers new users until the deadline.
+* ``login`` signs those users in, round-robin.
+* ``refresh`` has each client rotate its own refresh-token chain.
+* ``me`` fetches the profile with an access token from the login phase.
+
+Each phase reports requests per second and p50/p95/p99 latency. Non-2xx
+responses (429 from the rate limiter, 503 from hash load shedding) are
+counted by status code and left out of the latency figures.
+
+    python -m benchmarks.auth_load --concurrency 10 50 --json auth.json
+    python -m benchmarks.auth_load --compare auth.json --tolerance 0.25
+
+With ``--compare`` the run exits non-zero if any endpoint's p95 latency rose
+or its throughput fell by more than the tolerance against the saved results.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from collections import Counter
+from itertools import count
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from fastapi import FastAPI
+from passlib.context import CryptContext
+from sqlalchemy.orm import sessionmaker
+
+from fieldflux.db import create_sqlite_engine
+from server import auth, main
+from server.database import Base, get_db
+from server.hashing import BCRYPT_ROUNDS, PasswordHasher
+from server.principals import PrincipalCache
+from server.ratelimit import ROUTE_LIMITS, MemoryRateLimitBackend, RateLimit
+
+PASSWORD = "correct-horse-battery"
+# Budgets large enough that the limiter is exercised but never rejects.
+UNLIMITED = {route: RateLimit(limit=10**9, window_seconds=60) for route in ROUTE_LIMITS}
+
+
+def build_app(db_path: Path, bcrypt_rounds: int, rate_limits: str) -> FastAPI:
+    """Point the auth app at a fresh database and fresh per-process state."""
+    engine = create_sqlite_engine(f"sqlite:///{db_path}", name="auth-bench")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    def override_db():
+        with Session() as db:
+            yield db
+
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=bcrypt_rounds)
+    auth.password_hasher = PasswordHasher(context)
+    auth.rate_limiter = MemoryRateLimitBackend(ROUTE_LIMITS if rate_limits == "on" else UNLIMITED)
+    auth.principal_cache = PrincipalCache()
+    main.app.dependency_overrides[get_db] = override_db
+    return main.app
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(endpoint: str, concurrency: int, latencies, statuses, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    ok = len(latencies)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(ok / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run_phase(endpoint: str, concurrency: int, duration: float, make_request) -> dict:
+    """Run ``make_request(worker_id)`` from ``concurrency`` clients until the deadline."""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+
+    async def worker(worker_id: int) -> None:
+        while loop.time() < deadline:
+            start = time.perf_counter()
+            response = await make_request(worker_id)
+            elapsed = time.perf_counter() - start
+            statuses[response.status_code] += 1
+            if response.is_success:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return summarize(endpoint, concurrency, latencies, statuses, time.perf_counter() - started)
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, duration: float) -> List[dict]:
+    serial = count()
+    emails: List[str] = []
+    tokens: Dict[int, dict] = {}
+
+    async def signup(worker_id: int) -> httpx.Response:
+        email = f"bench-{concurrency}-{next(serial)}@example.com"
+        response = await client.post("/signup", json={"email": email, "password": PASSWORD})
+        if response.is_success:
+            emails.append(email)
+        return response
+
+    async def login(worker_id: int) -> httpx.Response:
+        email = emails[next(serial) % len(emails)]
+        response = await client.post("/login", json={"email": email, "password": PASSWORD})
+        if response.is_success:
+            tokens[worker_id] = response.json()
+        return response
+
+    async def refresh(worker_id: int) -> httpx.Response:
+        pair = tokens[worker_id]
+        response = await client.post("/token/refresh", params={"token": pair["refresh_token"]})
+        if response.is_success:
+            pair.update(response.json())
+        return response
+
+    async def me(worker_id: int) -> httpx.Response:
+        access_token = tokens[worker_id]["access_token"]
+        return await client.get("/me", headers={"Authorization": f"Bearer {access_token}"})
+
+    results = [await run_phase("signup", concurrency, duration, signup)]
+    if not emails:
+        return results
+    results.append(await run_phase("login", concurrency, duration, login))
+    if not tokens:
+        return results
+    # Workers without a token of their own would share one refresh chain and
+    # revoke each other's sessions on replay, so give each its own session.
+    for worker_id in range(concurrency):
+        if worker_id not in tokens:
+            await login(worker_id)
+    results.append(await run_phase("refresh", concurrency, duration, refresh))
+    results.append(await run_phase("me", concurrency, duration, me))
+    return results
+
+
+async def benchmark(args: argparse.Namespace) -> List[dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(Path(tmp) / "auth-bench.db", args.bcrypt_rounds, args.rate_limits)
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                results = []
+                for level in args.concurrency:
+                    results.extend(await run_level(client, level, args.duration))
+                return results
+        finally:
+            main.app.dependency_overrides.clear()
+
+
+def regressions(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Endpoints whose p95 or throughput moved past ``tolerance`` against ``baseline``."""
+    previous = {(row["endpoint"], row["concurrency"]): row for row in baseline}
+    problems = []
+    for row in results:
+        before = previous.get((row["endpoint"], row["concurrency"]))
+        if before is None:
+            continue
+        name = f"{row['endpoint']}@{row['concurrency']}"
+        if before["p95_ms"] and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+        rps_floor = before["requests_per_second"] * (1 - tolerance)
+        if row["requests_per_second"] < rps_floor:
+            problems.append(
+                f"{name}: {before['requests_per_second']} -> {row['requests_per_second']} req/s"
+            )
+    return problems
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per endpoint phase")
+    parser.add_argument("--bcrypt-rounds", type=int, default=BCRYPT_ROUNDS)
+    parser.add_argument(
+        "--rate-limits",
+        choices=["off", "on"],
+        default="off",
+        help="'on' applies the production per-route limits; every request shares one client IP",
+    )
+    parser.add_argument("--json", type=Path, help="Write results to this file as JSON")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+
+    print(
+        f"{'endpoint':<8} {'clients':>8} {'ok':>8} {'other':>6} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for row in results:
+        print(
+            f"{row['endpoint']:<8} {row['concurrency']:>8} {row['ok']:>8} "
+            f"{row['requests'] - row['ok']:>6} {row['requests_per_second']:>9} "
+            f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}"
+        )
+    if args.json:
+        config = {
+            "duration": args.duration,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "rate_limits": args.rate_limits,
+        }
+        args.json.write_text(json.dumps({"config": config, "results": results}, indent=2))
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+        problems = regressions(results, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
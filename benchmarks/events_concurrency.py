@@ -0,0 +1,178 @@
+"""Throughput benchmark for the sync and async event handlers.
+
+Drives the field/event routes in-process through httpx's ASGI transport with
+a throwaway SQLite file per mode, so numbers reflect handler and database
+overhead rather than network cost. Each client loops (90% reads, 10% writes)
+for a fixed duration; requests still waiting at the deadline are reported as
+stuck rather than counted toward throughput.
+
+    python -m benchmarks.events_concurrency --concurrency 50 200 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import async_api, main
+from backend.database import get_async_session, get_session
+from fieldflux.db import create_async_sqlite_engine, create_sqlite_engine
+
+ADMIN = {"X-Role": "admin"}
+FIELDS = 20
+EVENTS_PER_FIELD = 20
+
+
+def build_app(mode: str, db_path: Path) -> Tuple[FastAPI, List[Engine | AsyncEngine]]:
+    """The app for ``mode`` and the engines to dispose once the run is over."""
+    sync_engine = create_sqlite_engine(f"sqlite:///{db_path}", name="bench")
+    SQLModel.metadata.create_all(sync_engine)
+    engines: List[Engine | AsyncEngine] = [sync_engine]
+    app = FastAPI()
+
+    if mode == "async":
+        async_engine = create_async_sqlite_engine(f"sqlite+aiosqlite:///{db_path}", name="bench")
+        engines.append(async_engine)
+
+        async def override_async_session():
+            async with AsyncSession(async_engine) as session:
+                yield session
+
+        app.include_router(async_api.router)
+        app.dependency_overrides[get_async_session] = override_async_session
+    else:
+
+        def override_session():
+            with Session(sync_engine) as session:
+                yield session
+
+        app.include_router(main.events_router)
+        app.dependency_overrides[get_session] = override_session
+    return app, engines
+
+
+async def seed(client: httpx.AsyncClient) -> list[int]:
+    field_ids = []
+    for index in range(FIELDS):
+        response = await client.post("/fields", json={"name": f"Field {index}"}, headers=ADMIN)
+        field_ids.append(response.json()["id"])
+    for field_id in field_ids:
+        for day in range(EVENTS_PER_FIELD):
+            await client.post(
+                f"/fields/{field_id}/events",
+                json={
+                    "date": f"2023-{day % 12 + 1:02d}-{day % 28 + 1:02d}",
+                    "product": "Urea",
+                    "rate": 100.0,
+                    "operator": "bench",
+                },
+                headers=ADMIN,
+            )
+    return field_ids
+
+
+async def run_level(
+    client: httpx.AsyncClient, field_ids: list[int], concurrency: int, duration: float
+) -> dict:
+    completed = errors = timeouts = 0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+
+    async def worker(worker_id: int) -> None:
+        nonlocal completed, errors, timeouts
+        step = 0
+        while loop.time() < deadline:
+            field_id = field_ids[(worker_id + step) % len(field_ids)]
+            try:
+                async with asyncio.timeout_at(deadline):
+                    if step % 10 == 9:
+                        response = await client.post(
+                            f"/fields/{field_id}/events",
+                            json={
+                                "date": "2024-04-01",
+                                "product": "Urea",
+                                "rate": 1.0,
+                                "operator": "bench",
+                            },
+                            headers=ADMIN,
+                        )
+                    else:
+                        response = await client.get(f"/fields/{field_id}/events")
+            except TimeoutError:
+                timeouts += 1
+                return
+            step += 1
+            completed += 1
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "completed": completed,
+        "errors": errors,
+        "in_flight_at_deadline": timeouts,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round((completed - errors) / elapsed, 1),
+    }
+
+
+async def benchmark(mode: str, levels: list[int], duration: float) -> list[dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        app, engines = build_app(mode, Path(tmp) / "bench.db")
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                field_ids = await seed(client)
+                return [
+                    {"mode": mode, **await run_level(client, field_ids, level, duration)}
+                    for level in levels
+                ]
+        finally:
+            # aiosqlite connections run on their own threads, which would keep
+            # the interpreter from exiting if the engine were left open.
+            for engine in engines:
+                if isinstance(engine, AsyncEngine):
+                    await engine.dispose()
+                else:
+                    engine.dispose()
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"])
+    parser.add_argument("--json", type=Path, help="Write results to this file as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        results.extend(asyncio.run(benchmark(mode, args.concurrency, args.duration)))
+
+    print(f"{'mode':<6} {'clients':>8} {'completed':>10} {'errors':>7} {'stuck':>6} {'req/s':>9}")
+    for row in results:
+        print(
+            f"{row['mode']:<6} {row['concurrency']:>8} {row['completed']:>10} "
+            f"{row['errors']:>7} {row['in_flight_at_deadline']:>6} {row['requests_per_second']:>9}"
+        )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
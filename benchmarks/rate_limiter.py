@@ -0,0 +1,137 @@
+"""Microbenchmark of the auth rate limiter against the legacy list-based one.
+
+Two scenarios:
+
+* ``hot-key``: one client hammering a limiter with a large budget, which
+  makes the legacy limiter keep and trim a long timestamp list.
+* ``scan``: every request comes from a new address, as in a scan from many
+  IPs. This measures per-call cost and the memory still held afterwards.
+
+The SQLite backend shared between workers is included. Its "peak KiB" only
+counts Python allocations, not the database file.
+
+    python -m benchmarks.rate_limiter --requests 200000 --limit 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict
+
+from server.ratelimit import RateLimit, SlidingWindowLimiter, SQLiteRateLimitBackend
+
+
+class LegacyRateLimiter:
+    """The previous ``server.auth.RateLimiter``, kept here as the baseline."""
+
+    def __init__(self, limit: int, window_seconds: int):
+        self.limit = limit
+        self.window = window_seconds
+        self.requests: Dict[str, list[float]] = {}
+
+    def hit(self, key: str, now: float) -> bool:
+        history = self.requests.setdefault(key, [])
+        cutoff = now - self.window
+        while history and history[0] < cutoff:
+            history.pop(0)
+        if len(history) >= self.limit:
+            return False
+        history.append(now)
+        return True
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+
+class SQLiteLimiter:
+    """Adapts the shared SQLite backend to the single-route ``hit`` interface."""
+
+    def __init__(self, limit: int, window_seconds: float, directory: str):
+        self.backend = SQLiteRateLimitBackend(
+            f"{directory}/ratelimit-{time.perf_counter_ns()}.db",
+            {"bench": RateLimit(limit, window_seconds)},
+        )
+
+    def hit(self, key: str, now: float) -> bool:
+        return self.backend.hit("bench", key, now)
+
+    def __len__(self) -> int:
+        return self.backend.tracked_keys()["bench"]
+
+
+def _drive(limiter, keys, step: float) -> int:
+    rejected = 0
+    for i, key in enumerate(keys):
+        if not limiter.hit(key, now=i * step):
+            rejected += 1
+    return rejected
+
+
+def run(make_limiter, requests: int, scenario: str, window: float) -> dict:
+    # Spread requests over ten windows so expiry paths are exercised.
+    step = window * 10 / requests
+    if scenario == "hot-key":
+        keys = ["203.0.113.7"] * requests
+    else:
+        keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(requests)]
+
+    limiter = make_limiter()
+    start = time.perf_counter()
+    rejected = _drive(limiter, keys, step)
+    elapsed = time.perf_counter() - start
+
+    # Memory is measured on a second run; tracing would distort the timing.
+    tracemalloc.start()
+    _drive(make_limiter(), keys, step)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "scenario": scenario,
+        "limiter": type(limiter).__name__,
+        "requests": requests,
+        "rejected": rejected,
+        "ns_per_request": round(elapsed / requests * 1e9),
+        "tracked_keys": len(limiter),
+        "peak_kib": round(peak / 1024),
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--window", type=float, default=60.0)
+    parser.add_argument("--max-keys", type=int, default=10_000)
+    parser.add_argument("--json", type=Path, help="Write results to this file as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for scenario in ("hot-key", "scan"):
+            for make_limiter in (
+                lambda: LegacyRateLimiter(args.limit, args.window),
+                lambda: SlidingWindowLimiter(args.limit, args.window, max_keys=args.max_keys),
+                lambda: SQLiteLimiter(args.limit, args.window, directory),
+            ):
+                results.append(run(make_limiter, args.requests, scenario, args.window))
+
+    print(
+        f"{'scenario':<8} {'limiter':<22} {'ns/req':>8} {'rejected':>9} "
+        f"{'keys':>8} {'peak KiB':>9}"
+    )
+    for row in results:
+        print(
+            f"{row['scenario']:<8} {row['limiter']:<22} {row['ns_per_request']:>8} "
+            f"{row['rejected']:>9} {row['tracked_keys']:>8} {row['peak_kib']:>9}"
+        )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,198 @@
+"""Shared SQLAlchemy engine factory and schema migration for FieldFlux's SQLite databases."""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+import weakref
+
+from sqlalchemy import Column, MetaData, Table, create_engine, event, inspect, literal
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool, StaticPool
+from sqlalchemy.schema import CreateColumn
+
+from .metrics import REGISTRY, CallbackMetric, Histogram, HistogramFamily
+
+logger = logging.getLogger("fieldflux.db")
+
+# WAL lets readers proceed while a writer holds the lock. NORMAL drops the
+# per-commit fsync; WAL stays consistent after a crash but a power loss may
+# roll back the most recent commits.
+SQLITE_PRAGMAS: tuple[tuple[str, object], ...] = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -64 * 1024),
+    ("temp_store", "MEMORY"),
+)
+
+# Overflow is unbounded by default: SQLite connections are cheap, and a capped
+# pool deadlocks against FastAPI's threadpool because a finished sync request
+# keeps its session open while it waits for a thread to serialize the response.
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "20"))
+MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "-1"))
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_MS", "200")) / 1000
+
+QUERY_DURATIONS = REGISTRY.register(
+    HistogramFamily(
+        "fieldflux_db_query_duration_seconds",
+        "Time spent executing SQL statements, by database and verb.",
+        ("database", "verb"),
+    )
+)
+query_durations: dict[tuple[str, str], Histogram] = QUERY_DURATIONS.children
+# (name, engine) for every instrumented engine; weak so test engines can be collected.
+_engines: list[tuple[str, "weakref.ref[Engine]"]] = []
+
+
+def create_sqlite_engine(url: str, *, name: str, **kwargs) -> Engine:
+    """Build a sync engine with WAL pragmas, sized pooling and query timing."""
+    engine = create_engine(url, **_engine_options(url, QueuePool), **kwargs)
+    instrument_engine(engine, name)
+    return engine
+
+
+def create_async_sqlite_engine(url: str, *, name: str, **kwargs) -> AsyncEngine:
+    """Async counterpart of :func:`create_sqlite_engine` for aiosqlite URLs."""
+    engine = create_async_engine(url, **_engine_options(url, AsyncAdaptedQueuePool), **kwargs)
+    instrument_engine(engine.sync_engine, name)
+    return engine
+
+
+def query_histogram(database: str, verb: str) -> Histogram:
+    return QUERY_DURATIONS.labels(database, verb)
+
+
+def pool_stats() -> dict[tuple[str, str], int]:
+    """Connections per (database, state) summed over live engines with a sized pool."""
+    stats: dict[tuple[str, str], int] = {}
+    for name, ref in list(_engines):
+        engine = ref()
+        if engine is None:
+            _engines.remove((name, ref))
+            continue
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        for state, value in (
+            ("size", pool.size()),
+            ("checked_out", pool.checkedout()),
+            ("idle", pool.checkedin()),
+            ("overflow", max(pool.overflow(), 0)),
+        ):
+            stats[(name, state)] = stats.get((name, state), 0) + value
+    return stats
+
+
+REGISTRY.register(
+    CallbackMetric(
+        "fieldflux_db_pool_connections",
+        "Pooled SQLite connections by database and state.",
+        pool_stats,
+        ("database", "state"),
+    )
+)
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Apply SQLite pragmas on connect and time every cursor execution."""
+    _engines.append((name, weakref.ref(engine)))
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, _record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _record_duration(conn, _cursor, statement, _parameters, _context, _executemany) -> None:
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        query_histogram(name, verb).observe(elapsed)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            logger.warning(
+                "Slow %s query on %s took %.1f ms: %s",
+                verb,
+                name,
+                elapsed * 1000,
+                " ".join(statement.split())[:500],
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _discard_timer(context) -> None:
+        connection = context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+def migrate_schema(engine: Engine, metadata: MetaData) -> list[str]:
+    """Create missing tables and add columns and indexes that existing tables lack.
+
+    ``create_all`` leaves existing tables alone, so a column added to a model
+    never reaches a database created before it. This adds such columns with
+    ``ALTER TABLE ... ADD COLUMN``, filling existing rows from the column's
+    scalar default, then creates any indexes that are missing. Changed or
+    dropped columns are not handled. Returns the statements it ran.
+    """
+    metadata.create_all(bind=engine)
+    applied: list[str] = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                statement = _add_column_sql(table, column, connection.dialect)
+                connection.exec_driver_sql(statement)
+                applied.append(statement)
+            # The reflection API skips expression indexes; the pragma lists them all.
+            index_list = connection.exec_driver_sql(f"PRAGMA index_list({table.name!r})")
+            indexes = {row.name for row in index_list}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    applied.append(f"CREATE INDEX {index.name}")
+    for statement in applied:
+        logger.info("Migrated schema: %s", statement)
+    return applied
+
+
+def _add_column_sql(table: Table, column: Column, dialect) -> str:
+    if column.primary_key or column.unique:
+        raise RuntimeError(
+            f"Cannot add {table.name}.{column.name}: SQLite can't add a key or unique column"
+        )
+    definition = str(CreateColumn(column).compile(dialect=dialect))
+    if column.server_default is None:
+        default = column.default
+        if default is not None and default.is_scalar:
+            value = literal(default.arg, column.type).compile(
+                dialect=dialect, compile_kwargs={"literal_binds": True}
+            )
+            definition += f" DEFAULT {value}"
+        elif not column.nullable:
+            raise RuntimeError(
+                f"Cannot add NOT NULL column {table.name}.{column.name} without a scalar default"
+            )
+    return f"ALTER TABLE {dialect.identifier_preparer.format_table(table)} ADD COLUMN {definition}"
+
+
+def _engine_options(url: str, pool_class: type[Pool]) -> dict:
+    options: dict = {"connect_args": {"check_same_thread": False}}
+    database = make_url(url).database
+    if not database or database == ":memory:":
+        # Every checkout must see the same in-memory database.
+        options["poolclass"] = StaticPool
+    else:
+        options["poolclass"] = pool_class
+        options["pool_size"] = POOL_SIZE
+        options["max_overflow"] = MAX_OVERFLOW
+    return options
@@ -0,0 +1,72 @@
+"""Request metrics and the ``/metrics`` endpoint for the FieldFlux HTTP apps."""
+
+from __future__ import annotations
+
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from .metrics import CONTENT_TYPE, REGISTRY, Counter, HistogramFamily, render
+
+HTTP_REQUESTS = REGISTRY.register(
+    Counter(
+        "fieldflux_http_requests_total",
+        "HTTP requests by app, method, route template and status code.",
+        ("app", "method", "route", "status"),
+    )
+)
+HTTP_DURATIONS = REGISTRY.register(
+    HistogramFamily(
+        "fieldflux_http_request_duration_seconds",
+        "HTTP request latency by app, method and route template.",
+        ("app", "method", "route"),
+    )
+)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware that counts and times each HTTP request.
+
+    Routes are labelled by their template (``/fields/{field_id}``), never the
+    raw path, so the number of series stays bounded. Requests that match no
+    route share the ``unmatched`` label.
+    """
+
+    def __init__(self, app, name: str) -> None:
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_DURATIONS.labels(self.name, method, template).observe(
+                time.perf_counter() - start
+            )
+            HTTP_REQUESTS.inc(self.name, method, template, str(status_code))
+
+
+def instrument_app(app: FastAPI, name: str) -> None:
+    """Record request metrics for ``app`` and serve the registry at ``/metrics``."""
+    app.add_middleware(MetricsMiddleware, name=name)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> PlainTextResponse:
+        return PlainTextResponse(render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,303 @@
+"""In-process metric primitives shared by the FieldFlux services.
+
+Counters and histograms keep one shard per thread. A thread only ever writes
+its own shard, so the hot path takes no lock. Readers merge the shards when
+metrics are scraped, and a thread's shard is folded into a shared total when
+the thread exits. Metrics registered with :data:`REGISTRY` are rendered in
+the Prometheus text exposition format by :func:`render`.
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Sequence
+from typing import Generic, TypeVar, Union
+
+# Upper bounds in seconds, tuned for request and query latencies.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+S = TypeVar("S")
+LabelValues = tuple[str, ...]
+
+
+class _Retired:
+    """Lives only in a thread's local storage; collected when the thread exits."""
+
+
+class _ThreadShards(Generic[S]):
+    """One ``factory()`` object per live thread, plus a base for retired threads.
+
+    When a thread exits, its local storage is released. A finalizer then folds
+    the thread's shard into the base with ``merge`` and drops the shard. Pools
+    that keep replacing idle worker threads therefore don't grow the shard list.
+    """
+
+    def __init__(self, factory: Callable[[], S], merge: Callable[[S, S], None]) -> None:
+        self._factory = factory
+        self._merge = merge
+        self._local = threading.local()
+        self._base: S = factory()
+        self._live: dict[int, S] = {}
+        # Reentrant: a finalizer can run from garbage collection while this
+        # thread already holds the lock.
+        self._lock = threading.RLock()
+
+    def local(self) -> S:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._factory()
+            sentinel = _Retired()
+            with self._lock:
+                self._live[id(shard)] = shard
+            weakref.finalize(sentinel, self._retire, id(shard))
+            self._local.shard = shard
+            self._local.sentinel = sentinel
+            return shard
+
+    def all(self) -> list[S]:
+        with self._lock:
+            return [self._base.copy(), *self._live.values()]  # type: ignore[attr-defined]
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def _retire(self, key: int) -> None:
+        with self._lock:
+            shard = self._live.pop(key, None)
+            if shard is not None:
+                self._merge(self._base, shard)
+
+
+def _add_counts(base: list, shard: list) -> None:
+    for index, value in enumerate(list(shard)):
+        base[index] += value
+
+
+def _add_samples(base: dict, shard: dict) -> None:
+    for labels, value in shard.copy().items():
+        base[labels] = base.get(labels, 0) + value
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        # Per thread: one count per bucket, one for +Inf, then the running sum.
+        self._shards = _ThreadShards(lambda: [0] * (len(self.buckets) + 1) + [0.0], _add_counts)
+
+    def observe(self, value: float) -> None:
+        shard = self._shards.local()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> dict[str, object]:
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for shard in self._shards.all():
+            values = list(shard)
+            for index, count in enumerate(values[:-1]):
+                counts[index] += count
+            total += values[-1]
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets, counts, strict=False):
+            running += count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": sum(counts), "sum": total}
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards: _ThreadShards[dict[LabelValues, float]] = _ThreadShards(dict, _add_samples)
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        shard = self._shards.local()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self.samples().get(labelvalues, 0)
+
+    def samples(self) -> dict[LabelValues, float]:
+        merged: dict[LabelValues, float] = {}
+        for shard in self._shards.all():
+            for labels, value in shard.copy().items():
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def expose(self) -> Iterable[str]:
+        yield from _header(self)
+        for labels, value in sorted(self.samples().items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class HistogramFamily:
+    """A :class:`Histogram` per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.children: dict[LabelValues, Histogram] = {}
+
+    def labels(self, *labelvalues: str) -> Histogram:
+        histogram = self.children.get(labelvalues)
+        if histogram is None:
+            histogram = self.children.setdefault(labelvalues, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        self.labels(*labelvalues).observe(value)
+
+    def expose(self) -> Iterable[str]:
+        yield from _header(self)
+        for labels, histogram in sorted(self.children.copy().items()):
+            yield from _histogram_lines(self.name, self.labelnames, labels, histogram)
+
+
+class CallbackMetric:
+    """Gauge or counter whose samples are read from ``collect()`` at scrape time.
+
+    ``collect`` returns a number, or a mapping of label-value tuples to numbers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Union[float, dict[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def expose(self) -> Iterable[str]:
+        yield from _header(self)
+        samples = self.collect()
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        for labels, value in sorted(samples.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class CallbackHistogram:
+    """Exposes a :class:`Histogram` returned by ``collect()`` at scrape time."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Histogram]) -> None:
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labelnames: tuple[str, ...] = ()
+
+    def expose(self) -> Iterable[str]:
+        yield from _header(self)
+        yield from _histogram_lines(self.name, (), (), self.collect())
+
+
+Metric = Union[Counter, HistogramFamily, CallbackMetric, CallbackHistogram]
+M = TypeVar("M", Counter, HistogramFamily, CallbackMetric, CallbackHistogram)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: M) -> M:
+        """Add ``metric``; if its name is taken, return the metric already registered."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)  # type: ignore[return-value]
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def _header(metric) -> Iterable[str]:
+    yield f"# HELP {metric.name} {metric.help}"
+    yield f"# TYPE {metric.name} {metric.kind}"
+
+
+def _histogram_lines(
+    name: str, labelnames: Sequence[str], labelvalues: LabelValues, histogram: Histogram
+) -> Iterable[str]:
+    snapshot = histogram.snapshot()
+    for bound, count in snapshot["buckets"]:
+        labels = _labels((*labelnames, "le"), (*labelvalues, _number(bound)))
+        yield f"{name}_bucket{labels} {count}"
+    labels = _labels((*labelnames, "le"), (*labelvalues, "+Inf"))
+    yield f"{name}_bucket{labels} {snapshot['count']}"
+    yield f"{name}_sum{_labels(labelnames, labelvalues)} {_number(snapshot['sum'])}"
+    yield f"{name}_count{_labels(labelnames, labelvalues)} {snapshot['count']}"
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
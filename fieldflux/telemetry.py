@@ -1,28 +1,320 @@
-"""Telemetry primitives for analytics and error monitoring."""
+"""Telemetry primitives for analytics and error monitoring.
+
+Captured payloads go into a bounded ring buffer, so memory stays flat however
+long the process runs. If a sink is configured, a background thread drains the
+buffer in batches. It flushes once ``batch_size`` payloads are waiting or every
+``flush_interval`` seconds, whichever comes first. When the buffer is full,
+the oldest unflushed payload is overwritten and counted in ``dropped``.
+Capturing never blocks on the sink.
+
+Set ``TELEMETRY_DIR`` to write NDJSON files there by default. Without it,
+nothing is exported and the buffer keeps only the most recent payloads.
+"""
 
 from __future__ import annotations
 
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
-from typing import Dict, List
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Protocol, Sequence, Tuple
+
+TELEMETRY_DIR = os.getenv("TELEMETRY_DIR")
+TELEMETRY_BUFFER_SIZE = int(os.getenv("TELEMETRY_BUFFER_SIZE", "10000"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))
+TELEMETRY_FLUSH_SECONDS = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "1.0"))
+# Context fields that, with the error name, identify one kind of error.
+ERROR_FINGERPRINT_FIELDS: Tuple[str, ...] = ("action",)
+ERROR_MAX_EXEMPLARS = int(os.getenv("ERROR_MAX_EXEMPLARS", "5"))
+ERROR_MAX_GROUPS = int(os.getenv("ERROR_MAX_GROUPS", "1000"))
+
+logger = logging.getLogger(__name__)
+
+Payload = Dict[str, object]
+
+
+class TelemetrySink(Protocol):
+    def write(self, batch: List[Payload]) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class NdjsonFileSink:
+    """Appends each payload as one JSON line to ``path``."""
+
+    def __init__(self, path: os.PathLike | str) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, batch: List[Payload]) -> None:
+        data = "".join(json.dumps(payload, default=str) + "\n" for payload in batch)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def default_sink(filename: str) -> Optional[TelemetrySink]:
+    return NdjsonFileSink(Path(TELEMETRY_DIR) / filename) if TELEMETRY_DIR else None
+
+
+class TelemetryBuffer:
+    """Bounded ring buffer with an optional background batch flusher."""
+
+    def __init__(
+        self,
+        capacity: int = TELEMETRY_BUFFER_SIZE,
+        sink: Optional[TelemetrySink] = None,
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        flush_interval: float = TELEMETRY_FLUSH_SECONDS,
+    ) -> None:
+        self.capacity = capacity
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Best-effort under concurrent captures; increments are not locked.
+        self.dropped = 0
+        self.sink_errors = 0
+        self._buffer: Deque[Payload] = deque(maxlen=capacity)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        if sink is not None:
+            self._thread = threading.Thread(
+                target=self._run, name="telemetry-flusher", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def append(self, payload: Payload) -> None:
+        # deque.append is atomic; with maxlen set it evicts the oldest entry.
+        buffer = self._buffer
+        if len(buffer) == self.capacity:
+            self.dropped += 1
+        buffer.append(payload)
+        if self._thread is not None and len(buffer) >= self.batch_size:
+            if not self._wake.is_set():
+                self._wake.set()
+
+    def snapshot(self) -> List[Payload]:
+        """Payloads currently buffered, oldest first."""
+        return list(self._buffer)
+
+    def flush(self) -> int:
+        """Drain the buffer to the sink in batches and return how many were written."""
+        if self.sink is None:
+            return 0
+        written = 0
+        with self._flush_lock:
+            while self._buffer:
+                batch = self._take(self.batch_size)
+                try:
+                    self.sink.write(batch)
+                except Exception:
+                    self.sink_errors += 1
+                    self.dropped += len(batch)
+                    logger.exception("Telemetry sink failed; dropped %d payloads", len(batch))
+                    break
+                written += len(batch)
+        return written
+
+    def close(self) -> None:
+        """Stop the flusher, write what is left and close the sink."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+        self.sink.close()
+
+    def _take(self, limit: int) -> List[Payload]:
+        batch = []
+        popleft = self._buffer.popleft
+        for _ in range(limit):
+            try:
+                batch.append(popleft())
+            except IndexError:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
 
 
-@dataclass
 class EventLogger:
     """Collects structured analytics events for feature usage."""
 
-    events: List[Dict[str, object]] = field(default_factory=list)
+    def __init__(
+        self,
+        capacity: int = TELEMETRY_BUFFER_SIZE,
+        sink: Optional[TelemetrySink] = None,
+        **buffer_options,
+    ) -> None:
+        self.buffer = TelemetryBuffer(
+            capacity, sink or default_sink("events.ndjson"), **buffer_options
+        )
+
+    @property
+    def events(self) -> List[Payload]:
+        """Events still in the buffer; flushed events are no longer listed."""
+        return self.buffer.snapshot()
+
+    @property
+    def dropped(self) -> int:
+        return self.buffer.dropped
 
     def capture(self, name: str, properties: Dict[str, object]) -> None:
-        payload = {"event": name, **properties}
-        self.events.append(payload)
+        self.buffer.append({"event": name, **properties})
+
+    def flush(self) -> int:
+        return self.buffer.flush()
+
+    def close(self) -> None:
+        self.buffer.close()
 
 
 @dataclass
+class ErrorGroup:
+    """Every occurrence of one fingerprint, with a uniform sample of payloads."""
+
+    fingerprint: str
+    error: str
+    key: Dict[str, object]
+    count: int = 0
+    first_seen: float = 0.0
+    last_seen: float = 0.0
+    exemplars: List[Payload] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "fingerprint": self.fingerprint,
+            "error": self.error,
+            "key": dict(self.key),
+            "count": self.count,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "exemplars": list(self.exemplars),
+        }
+
+
 class ErrorMonitor:
-    """Captures errors that would normally be sent to a monitoring service."""
+    """Aggregates errors by fingerprint before they reach a monitoring service.
+
+    The fingerprint is the error name plus the values of ``fingerprint_fields``
+    in the context. Each group counts occurrences, records first and last seen
+    times, and keeps up to ``max_exemplars`` payloads chosen by reservoir
+    sampling. Only payloads that become exemplars are buffered for the sink.
+    Repeats of the same error therefore cost a counter increment, and the
+    forwarded volume grows logarithmically with the count. At most
+    ``max_groups`` groups are kept, and the least recently seen is evicted first.
+    """
+
+    def __init__(
+        self,
+        capacity: int = TELEMETRY_BUFFER_SIZE,
+        sink: Optional[TelemetrySink] = None,
+        fingerprint_fields: Sequence[str] = ERROR_FINGERPRINT_FIELDS,
+        max_exemplars: int = ERROR_MAX_EXEMPLARS,
+        max_groups: int = ERROR_MAX_GROUPS,
+        **buffer_options,
+    ) -> None:
+        self.buffer = TelemetryBuffer(
+            capacity, sink or default_sink("errors.ndjson"), **buffer_options
+        )
+        self.fingerprint_fields = tuple(fingerprint_fields)
+        self.max_exemplars = max_exemplars
+        self.max_groups = max_groups
+        self.total = 0
+        self.evicted_groups = 0
+        self._groups: OrderedDict[Tuple, ErrorGroup] = OrderedDict()
+        self._random = random.Random()
+        self._lock = threading.Lock()
 
-    errors: List[Dict[str, object]] = field(default_factory=list)
+    @property
+    def errors(self) -> List[Payload]:
+        """Sampled error payloads still in the buffer; flushed ones are no longer listed."""
+        return self.buffer.snapshot()
+
+    @property
+    def dropped(self) -> int:
+        return self.buffer.dropped
 
     def capture_error(self, name: str, context: Dict[str, object]) -> None:
-        payload = {"error": name, **context}
-        self.errors.append(payload)
+        now = time.time()
+        key = (name, *(context.get(field_name) for field_name in self.fingerprint_fields))
+        with self._lock:
+            self.total += 1
+            group = self._groups.get(key)
+            if group is None:
+                group = self._new_group(key, now)
+            else:
+                self._groups.move_to_end(key)
+            group.count += 1
+            group.last_seen = now
+            slot = self._exemplar_slot(group.count)
+            if slot is None:
+                return
+            payload = {"error": name, **context}
+            if slot == len(group.exemplars):
+                group.exemplars.append(payload)
+            else:
+                group.exemplars[slot] = payload
+        self.buffer.append(payload)
+
+    def summary(self, limit: Optional[int] = None) -> List[Dict[str, object]]:
+        """Groups as dicts, most frequent first."""
+        with self._lock:
+            groups = sorted(self._groups.values(), key=lambda group: group.count, reverse=True)
+            return [group.as_dict() for group in groups[:limit]]
+
+    def group(self, name: str, **key_fields: object) -> Optional[ErrorGroup]:
+        key = (name, *(key_fields.get(field_name) for field_name in self.fingerprint_fields))
+        return self._groups.get(key)
+
+    def flush(self) -> int:
+        return self.buffer.flush()
+
+    def close(self) -> None:
+        self.buffer.close()
+
+    def _new_group(self, key: Tuple, now: float) -> ErrorGroup:
+        name, *values = key
+        fields = {
+            field_name: value
+            for field_name, value in zip(self.fingerprint_fields, values, strict=True)
+            if value is not None
+        }
+        fingerprint = name + "".join(f"[{label}={value}]" for label, value in fields.items())
+        group = ErrorGroup(fingerprint, name, fields, first_seen=now)
+        self._groups[key] = group
+        if len(self._groups) > self.max_groups:
+            self._groups.popitem(last=False)
+            self.evicted_groups += 1
+        return group
+
+    def _exemplar_slot(self, count: int) -> Optional[int]:
+        """Reservoir sampling: where the ``count``-th payload goes, or None to skip it."""
+        if count <= self.max_exemplars:
+            return count - 1
+        slot = self._random.randrange(count)
+        return slot if slot < self.max_exemplars else None
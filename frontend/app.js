@@ -84,14 +84,56 @@ async function recordPayment(id, amount) {
   if (!res.ok) throw new Error("Failed to record payment");
 }
 
-async function fetchInvoices() {
-  const res = await fetch(`${API}/invoices`);
-  const invoices = await res.json();
-  renderInvoices(invoices);
+const INVOICE_PAGE_SIZE = 25;
+const invoiceFilters = document.getElementById("invoice-filters");
+const invoiceStats = document.getElementById("invoice-stats");
+const loadMoreBtn = document.getElementById("load-more");
+let nextCursor = null;
+
+function filterParams() {
+  const params = new URLSearchParams();
+  for (const [key, value] of new FormData(invoiceFilters).entries()) {
+    if (value) params.set(key, value);
+  }
+  return params;
+}
+
+async function fetchStats() {
+  const params = filterParams();
+  params.delete("status");
+  const res = await fetch(`${API}/invoices/stats?${params}`);
+  renderStats(await res.json());
 }
 
-function renderInvoices(invoices) {
-  invoiceList.innerHTML = "";
+function renderStats(stats) {
+  const statusRows = stats.by_status
+    .map((row) => `<li>${row.status}: ${row.count} ($${row.total.toFixed(2)})</li>`)
+    .join("");
+  const monthRows = stats.by_month
+    .map((row) => `<li>${row.month}: ${row.count} ($${row.total.toFixed(2)})</li>`)
+    .join("");
+  invoiceStats.innerHTML = `
+    <div class="balance">${stats.count} invoices · $${stats.total.toFixed(2)} billed</div>
+    <div class="grid">
+      <ul>${statusRows || "<li>No invoices</li>"}</ul>
+      <ul>${monthRows}</ul>
+    </div>
+  `;
+}
+
+async function fetchInvoices({ append = false } = {}) {
+  const params = filterParams();
+  params.set("limit", INVOICE_PAGE_SIZE);
+  if (append && nextCursor) params.set("after_id", nextCursor);
+  const res = await fetch(`${API}/invoices?${params}`);
+  nextCursor = res.headers.get("X-Next-Cursor");
+  loadMoreBtn.hidden = !nextCursor;
+  renderInvoices(await res.json(), append);
+  if (!append) fetchStats();
+}
+
+function renderInvoices(invoices, append = false) {
+  if (!append) invoiceList.innerHTML = "";
   invoices.forEach((inv) => {
     const card = document.createElement("div");
     card.className = "invoice-card";
@@ -159,6 +201,13 @@ invoiceForm.addEventListener("submit", async (e) => {
   fetchInvoices();
 });
 
+invoiceFilters.addEventListener("submit", (e) => {
+  e.preventDefault();
+  fetchInvoices();
+});
+
+loadMoreBtn.addEventListener("click", () => fetchInvoices({ append: true }));
+
 fetchInvoices();
 const API_BASE = (() => {
   if (typeof window !== "undefined") {
@@ -272,6 +321,20 @@ async function handleLogout() {
   statusEl.textContent = "Logged out";
 }
 
+async function handleLogoutEverywhere() {
+  const statusEl = document.getElementById("login-status");
+  statusEl.textContent = "Logging out of all devices...";
+  try {
+    const result = await api("/logout/all", { method: "POST" });
+    statusEl.textContent = `Logged out of ${result.sessions_revoked} session(s)`;
+  } catch (err) {
+    statusEl.textContent = err.message;
+    return;
+  }
+  store.clear();
+  document.getElementById("profile").textContent = "";
+}
+
 async function handleResetRequest(event) {
   event.preventDefault();
   const email = document.getElementById("reset-email").value;
@@ -334,6 +397,7 @@ function init() {
   document.getElementById("signup-form").addEventListener("submit", handleSignup);
   document.getElementById("login-form").addEventListener("submit", handleLogin);
   document.getElementById("logout").addEventListener("click", handleLogout);
+  document.getElementById("logout-all").addEventListener("click", handleLogoutEverywhere);
   document.getElementById("reset-request-form").addEventListener("submit", handleResetRequest);
   document.getElementById("reset-confirm-form").addEventListener("submit", handleResetConfirm);
   store.subscribe((state) => {
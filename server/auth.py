@@ -1,57 +1,92 @@
 import os
-import time
+import secrets
 from datetime import datetime, timedelta
-from typing import Annotated, Dict, Optional
+from typing import Annotated, Optional
 
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from fieldflux.metrics import REGISTRY, CallbackHistogram, CallbackMetric, Counter
 
 from .database import get_db
+from .hashing import HashingOverloaded, PasswordHasher
 from .models import User
+from .principals import PrincipalCache
+from .ratelimit import build_backend
+from .tokens import EmailTokenStore
 
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 14
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 
-class RateLimiter:
-    def __init__(self, limit: int, window_seconds: int):
-        self.limit = limit
-        self.window = window_seconds
-        self.requests: Dict[str, list[float]] = {}
+rate_limiter = build_backend()
+password_hasher = PasswordHasher()
+principal_cache = PrincipalCache()
+password_reset_tokens = EmailTokenStore("password_reset")
+verification_tokens = EmailTokenStore("verification")
 
-    def check(self, key: str):
-        now = time.time()
-        history = self.requests.setdefault(key, [])
-        cutoff = now - self.window
-        while history and history[0] < cutoff:
-            history.pop(0)
-        if len(history) >= self.limit:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Rate limit exceeded, please try again later.",
-            )
-        history.append(now)
+RATE_LIMIT_REJECTIONS = REGISTRY.register(
+    Counter(
+        "fieldflux_auth_rate_limit_rejections_total",
+        "Requests rejected with 429 by the auth rate limiter.",
+        ("route",),
+    )
+)
+# Callbacks read the module attributes at scrape time so swapped instances are seen.
+REGISTRY.register(
+    CallbackMetric(
+        "fieldflux_auth_hash_queue_depth",
+        "Password hashing jobs admitted but not yet finished.",
+        lambda: password_hasher.queue_depth,
+    )
+)
+REGISTRY.register(
+    CallbackMetric(
+        "fieldflux_auth_hash_rejections_total",
+        "Password hashing jobs shed because the executor was saturated.",
+        lambda: password_hasher.rejected,
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    CallbackHistogram(
+        "fieldflux_auth_hash_duration_seconds",
+        "Time spent hashing or verifying a password.",
+        lambda: password_hasher.durations,
+    )
+)
 
 
-rate_limiter = RateLimiter(limit=20, window_seconds=60)
-password_reset_tokens: Dict[str, tuple[str, float]] = {}
-verification_tokens: Dict[str, tuple[str, float]] = {}
+async def _hash_or_shed(func, *args):
+    try:
+        return await func(*args)
+    except HashingOverloaded as err:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        ) from err
+
 
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _hash_or_shed(password_hasher.verify, plain_password, hashed_password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
 
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, Optional[str]]:
+    """Verify, and return a new hash if the stored one uses outdated parameters."""
+    return await _hash_or_shed(password_hasher.verify_and_update, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+
+async def get_password_hash(password: str) -> str:
+    return await _hash_or_shed(password_hasher.hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -61,16 +96,32 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def create_refresh_token(user_id: int):
+def create_refresh_token(user_id: int, session_id: str) -> tuple[str, datetime]:
+    """Return a refresh token for the session and its expiry."""
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode = {"sub": str(user_id), "type": "refresh", "exp": expire}
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode = {
+        "sub": str(user_id),
+        "sid": session_id,
+        "jti": secrets.token_urlsafe(8),
+        "type": "refresh",
+        "exp": expire,
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM), expire
 
 
 def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
     db: Annotated[Session, Depends(get_db)],
 ) -> User:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        # Attach a persistent instance without a SELECT; unloaded columns
+        # are fetched lazily if the handler reads them.
+        user = User(**principal.user_fields)
+        make_transient_to_detached(user)
+        db.add(user)
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -85,34 +136,43 @@ def get_current_user(
     user = db.query(User).filter(User.id == int(user_id)).first()
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    principal_cache.put(token, user, payload)
     return user
 
 
-def enforce_rate_limit(request: Request):
+def get_session_id(token: Annotated[str, Depends(oauth2_scheme)]) -> Optional[str]:
+    """The ``sid`` claim of the bearer token; use after ``get_current_user``."""
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal.claims.get("sid")
+    return jwt.get_unverified_claims(token).get("sid")
+
+
+def enforce_rate_limit(request: Request, route: str = "default"):
     client_ip = request.client.host if request.client else "anonymous"
-    rate_limiter.check(client_ip)
+    if not rate_limiter.hit(route, client_ip):
+        RATE_LIMIT_REJECTIONS.inc(route)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded, please try again later.",
+            headers={"Retry-After": str(rate_limiter.retry_after(route))},
+        )
 
 
 def create_email_token(
-    email: str, store: Dict[str, tuple[str, float]], ttl_seconds: int = 3600
+    db: Session, email: str, store: EmailTokenStore, ttl_seconds: int = 3600
 ) -> str:
-    token = create_access_token(
-        {"sub": email, "purpose": "email"}, timedelta(seconds=ttl_seconds)
-    )
-    store[token] = (email, time.time() + ttl_seconds)
-    return token
+    return store.issue(db, email, ttl_seconds)
 
 
-def consume_email_token(token: str, store: Dict[str, tuple[str, float]]) -> str:
-    record = store.get(token)
+def consume_email_token(db: Session, token: str, store: EmailTokenStore) -> str:
+    record = store.redeem(db, token)
     if not record:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired token",
         )
     email, expires_at = record
-    if time.time() > expires_at:
-        store.pop(token, None)
+    if datetime.utcnow() > expires_at:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Token expired")
-    store.pop(token, None)
     return email
@@ -1,9 +1,10 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from fieldflux.db import create_sqlite_engine
+
 DATABASE_URL = "sqlite:///./fieldflux.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_sqlite_engine(DATABASE_URL, name="auth")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
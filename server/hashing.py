@@ -0,0 +1,89 @@
+"""Password hashing on a bounded, dedicated executor.
+
+bcrypt costs tens to hundreds of milliseconds of CPU per call. Running it on
+its own small pool caps how many cores a login burst can take. Bounding the
+number of admitted jobs lets the API shed load with a 503 instead of queueing
+requests until they time out. Callers await the pool from ``async def``
+handlers, so no request thread is held while a hash runs.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+from passlib.context import CryptContext
+
+from fieldflux.metrics import Histogram
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs admitted at once (running plus queued) before new ones are rejected.
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+T = TypeVar("T")
+
+# Hashes made with a different cost are re-hashed on the next successful login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hash executor already has ``max_pending`` jobs."""
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        context: CryptContext = pwd_context,
+        workers: int = HASH_WORKERS,
+        max_pending: int = HASH_MAX_PENDING,
+    ) -> None:
+        self.context = context
+        self.max_pending = max_pending
+        self.durations = Histogram()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs admitted but not yet finished."""
+        return self._pending
+
+    @property
+    def rejected(self) -> int:
+        return self._rejected
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self.context.verify, password, hashed)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Verify, returning a replacement hash when ``needs_update`` flags the old one."""
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HashingOverloaded
+            self._pending += 1
+        try:
+            return await asyncio.wrap_future(self._executor.submit(self._timed, func, *args))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _timed(self, func: Callable[..., T], *args) -> T:
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.durations.observe(time.perf_counter() - start)
@@ -1,9 +1,10 @@
-import os
+import logging
 from datetime import timedelta
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Optional
 
 from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 
@@ -13,6 +14,7 @@ if __package__ is None or __package__ == "":
     sys.path.append(str(Path(__file__).resolve().parent.parent))
     __package__ = "server"
 
+from fieldflux.instrumentation import instrument_app
 from server import auth
 from server.auth import (
     consume_email_token,
@@ -22,10 +24,10 @@ from server.auth import (
     enforce_rate_limit,
     get_current_user,
     get_password_hash,
+    get_session_id,
     password_reset_tokens,
-    rate_limiter,
     verification_tokens,
-    verify_password,
+    verify_and_update_password,
 )
 from server.database import Base, engine, get_db
 from server.models import User
@@ -38,8 +40,19 @@ from server.schemas import (
     UserLogin,
     UserResponse,
 )
+from server.sessions import (
+    new_session_id,
+    open_session,
+    purge_expired_sessions,
+    revoke_session,
+    revoke_user_sessions,
+    rotate_session,
+)
+from server.tokens import ExpiryPurger, purge_expired_tokens
 
 app = FastAPI(title="FieldFlux Auth API")
+logger = logging.getLogger(__name__)
+expiry_purger = ExpiryPurger([purge_expired_tokens, purge_expired_sessions])
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,68 +61,118 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument_app(app, "auth")
 
 
 @app.on_event("startup")
 def on_startup():
     Base.metadata.create_all(bind=engine)
+    expiry_purger.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    expiry_purger.stop()
+
+
+def _find_user(db: Session, email: str) -> Optional[User]:
+    return db.query(User).filter(User.email == email).first()
+
+
+def _create_user(db: Session, email: str, password_hash: str) -> User:
+    user = User(email=email, password_hash=password_hash)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    verification_token = create_email_token(db, user.email, verification_tokens)
+    logger.info("Email verification token generated for %s: %s", user.email, verification_token)
+    return user
+
+
+def _start_session(
+    db: Session, user: User, upgraded_hash: Optional[str], request: Request
+) -> TokenResponse:
+    if upgraded_hash:
+        user.password_hash = upgraded_hash
+
+    session_id = new_session_id()
+    refresh_token, expires_at = create_refresh_token(user.id, session_id)
+    open_session(
+        db,
+        session_id,
+        user.id,
+        refresh_token,
+        expires_at,
+        user_agent=request.headers.get("user-agent"),
+        ip_address=request.client.host if request.client else None,
+    )
+    access_token = create_access_token(
+        {"sub": str(user.id), "sid": session_id},
+        expires_delta=timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    return TokenResponse(access_token=access_token, refresh_token=refresh_token)
 
 
+# The handlers that hash passwords are async so a bcrypt call occupies only the
+# hash executor; their database work still runs on the threadpool.
 @app.post("/signup", response_model=UserResponse)
-def signup(
+async def signup(
     payload: UserCreate, request: Request, db: Annotated[Session, Depends(get_db)]
 ):
-    enforce_rate_limit(request)
+    await run_in_threadpool(enforce_rate_limit, request, "signup")
 
-    existing = db.query(User).filter(User.email == payload.email.lower()).first()
-    if existing:
+    email = payload.email.lower()
+    if await run_in_threadpool(_find_user, db, email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
-    hashed_password = get_password_hash(payload.password)
-    user = User(email=payload.email.lower(), password_hash=hashed_password)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-
-    verification_token = create_email_token(user.email, verification_tokens)
-    app.logger.info("Email verification token generated for %s: %s", user.email, verification_token)
-
-    return user
+    hashed_password = await get_password_hash(payload.password)
+    return await run_in_threadpool(_create_user, db, email, hashed_password)
 
 
 @app.post("/login", response_model=TokenResponse)
-def login(
+async def login(
     payload: UserLogin, request: Request, db: Annotated[Session, Depends(get_db)]
 ):
-    enforce_rate_limit(request)
+    await run_in_threadpool(enforce_rate_limit, request, "login")
 
-    user = db.query(User).filter(User.email == payload.email.lower()).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+    user = await run_in_threadpool(_find_user, db, payload.email.lower())
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-
-    access_token = create_access_token(
-        {"sub": str(user.id)},
-        expires_delta=timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES),
-    )
-    refresh_token = create_refresh_token(user.id)
-    user.refresh_token = refresh_token
-    db.commit()
-    return TokenResponse(access_token=access_token, refresh_token=refresh_token)
+    valid, upgraded_hash = await verify_and_update_password(payload.password, user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    return await run_in_threadpool(_start_session, db, user, upgraded_hash, request)
 
 
 @app.post("/logout")
 def logout(
     current_user: Annotated[User, Depends(get_current_user)],
+    session_id: Annotated[Optional[str], Depends(get_session_id)],
     db: Annotated[Session, Depends(get_db)],
 ):
-    current_user.refresh_token = None
-    db.commit()
+    if session_id:
+        revoke_session(db, session_id)
+    else:
+        # Access tokens issued before sessions existed carry no sid.
+        revoke_user_sessions(db, current_user.id)
+    auth.principal_cache.invalidate_user(current_user.id)
     return {"message": "Logged out"}
 
 
+@app.post("/logout/all")
+def logout_everywhere(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    revoked = revoke_user_sessions(db, current_user.id)
+    auth.principal_cache.invalidate_user(current_user.id)
+    return {"message": "Logged out everywhere", "sessions_revoked": revoked}
+
+
 @app.post("/token/refresh", response_model=TokenResponse)
 def refresh(token: str, db: Annotated[Session, Depends(get_db)]):
     try:
@@ -120,23 +183,22 @@ def refresh(token: str, db: Annotated[Session, Depends(get_db)]):
                 detail="Invalid token type",
             )
         user_id = int(payload.get("sub"))
+        session_id = payload.get("sid")
     except auth.JWTError as err:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token",
         ) from err
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user or user.refresh_token != token:
+    new_refresh, expires_at = create_refresh_token(user_id, session_id)
+    if not session_id or rotate_session(db, session_id, token, new_refresh, expires_at) is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh token revoked",
         )
 
-    new_access = create_access_token({"sub": str(user.id)})
-    new_refresh = create_refresh_token(user.id)
-    user.refresh_token = new_refresh
-    db.commit()
+    new_access = create_access_token({"sub": str(user_id), "sid": session_id})
+    auth.principal_cache.invalidate_user(user_id)
     return TokenResponse(access_token=new_access, refresh_token=new_refresh)
 
 
@@ -144,27 +206,40 @@ def refresh(token: str, db: Annotated[Session, Depends(get_db)]):
 def request_password_reset(
     payload: EmailRequest, request: Request, db: Annotated[Session, Depends(get_db)]
 ):
-    enforce_rate_limit(request)
+    enforce_rate_limit(request, "password_reset")
     user = db.query(User).filter(User.email == payload.email.lower()).first()
     if not user:
         # Avoid leaking user existence
         return {"message": "If the account exists, reset instructions have been sent"}
 
-    token = create_email_token(user.email, password_reset_tokens)
-    app.logger.info("Password reset token for %s: %s", user.email, token)
+    token = create_email_token(db, user.email, password_reset_tokens)
+    logger.info("Password reset token for %s: %s", user.email, token)
     return {"message": "If the account exists, reset instructions have been sent"}
 
 
-@app.post("/password-reset/confirm")
-def reset_password(payload: PasswordResetConfirm, db: Annotated[Session, Depends(get_db)]):
-    email = consume_email_token(payload.token, password_reset_tokens)
-    user = db.query(User).filter(User.email == email.lower()).first()
+def _user_for_reset_token(db: Session, token: str) -> User:
+    email = consume_email_token(db, token, password_reset_tokens)
+    user = _find_user(db, email.lower())
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
+
 
-    user.password_hash = get_password_hash(payload.new_password)
-    user.refresh_token = None
+def _set_password(db: Session, user: User, password_hash: str) -> None:
+    user.password_hash = password_hash
     db.commit()
+    revoke_user_sessions(db, user.id)
+    auth.principal_cache.invalidate_user(user.id)
+
+
+@app.post("/password-reset/confirm")
+async def reset_password(
+    payload: PasswordResetConfirm, request: Request, db: Annotated[Session, Depends(get_db)]
+):
+    await run_in_threadpool(enforce_rate_limit, request, "password_reset")
+    user = await run_in_threadpool(_user_for_reset_token, db, payload.token)
+    password_hash = await get_password_hash(payload.new_password)
+    await run_in_threadpool(_set_password, db, user, password_hash)
     return {"message": "Password updated"}
 
 
@@ -177,19 +252,20 @@ def request_verification(
     if not user:
         return {"message": "If the account exists, verification instructions have been sent"}
 
-    token = create_email_token(user.email, verification_tokens)
-    app.logger.info("Verification token for %s: %s", user.email, token)
+    token = create_email_token(db, user.email, verification_tokens)
+    logger.info("Verification token for %s: %s", user.email, token)
     return {"message": "Verification email triggered"}
 
 
 @app.post("/verify-email/confirm")
 def confirm_email(payload: TokenPayload, db: Annotated[Session, Depends(get_db)]):
-    email = consume_email_token(payload.token, verification_tokens)
+    email = consume_email_token(db, payload.token, verification_tokens)
     user = db.query(User).filter(User.email == email.lower()).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     user.is_verified = True
     db.commit()
+    auth.principal_cache.invalidate_user(user.id)
     return {"message": "Email verified"}
 
 
@@ -200,7 +276,4 @@ def me(current_user: Annotated[User, Depends(get_current_user)]):
 
 @app.get("/health")
 def health():
-    return {
-        "status": "ok",
-        "rate_limit_remaining": {k: len(v) for k, v in rate_limiter.requests.items()},
-    }
+    return {"status": "ok"}
@@ -0,0 +1,103 @@
+"""Short-lived cache of verified access tokens.
+
+A hit skips both the HS256 signature check and the user lookup. Entries live
+for at most ``PRINCIPAL_CACHE_TTL_SECONDS`` and never past the token's own
+``exp``. Logout, password reset and refresh rotation evict every entry for
+the user. Eviction is per process, so in a multi-worker deployment another
+worker may keep serving a cached principal for up to one TTL.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+# Columns copied into the cache; secrets such as the password hash are left
+# unloaded and fetched only if a handler actually reads them.
+USER_FIELDS = ("id", "email", "is_verified", "created_at")
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    claims: dict
+    user_fields: dict
+    expires_at: float
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class PrincipalCache:
+    def __init__(
+        self, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS, max_size: int = PRINCIPAL_CACHE_SIZE
+    ) -> None:
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Principal] = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str, now: Optional[float] = None) -> Optional[Principal]:
+        digest = token_digest(token)
+        now = time.time() if now is None else now
+        with self._lock:
+            principal = self._entries.get(digest)
+            if principal is None:
+                return None
+            if principal.expires_at <= now:
+                self._discard(digest)
+                return None
+            self._entries.move_to_end(digest)
+            return principal
+
+    def put(self, token: str, user, claims: dict, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        expires_at = min(now + self.ttl, float(claims.get("exp", now + self.ttl)))
+        if expires_at <= now:
+            return
+        digest = token_digest(token)
+        principal = Principal(
+            user_id=user.id,
+            claims=claims,
+            user_fields={field: getattr(user, field) for field in USER_FIELDS},
+            expires_at=expires_at,
+        )
+        with self._lock:
+            self._discard(digest)
+            self._entries[digest] = principal
+            self._by_user.setdefault(user.id, set()).add(digest)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for digest in list(self._by_user.get(user_id, ())):
+                self._discard(digest)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _discard(self, digest: str) -> None:
+        principal = self._entries.pop(digest, None)
+        if principal is None:
+            return
+        digests = self._by_user.get(principal.user_id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[principal.user_id]
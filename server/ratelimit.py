@@ -0,0 +1,235 @@
+"""Request rate limiting for the auth endpoints.
+
+Limits are enforced by a backend chosen with ``RATE_LIMIT_BACKEND``:
+
+* ``memory`` (default) keeps per-process counters, so every worker has its own
+  budget and a restart resets them.
+* ``sqlite`` keeps the counters in a SQLite file (``RATE_LIMIT_DB``) that
+  every worker on the host shares. The counters also survive restarts.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from fieldflux.db import SQLITE_PRAGMAS
+
+MAX_TRACKED_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "./ratelimit.db")
+# Expired counters are deleted in one statement at most this often per process.
+EXPIRY_INTERVAL_SECONDS = float(os.getenv("RATE_LIMIT_EXPIRY_SECONDS", "30"))
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    limit: int
+    window_seconds: float
+
+
+# Per-route budgets; "default" covers every other rate-limited endpoint.
+ROUTE_LIMITS: Dict[str, RateLimit] = {
+    "default": RateLimit(limit=20, window_seconds=60),
+    "signup": RateLimit(limit=5, window_seconds=600),
+    "login": RateLimit(limit=10, window_seconds=60),
+    "password_reset": RateLimit(limit=5, window_seconds=900),
+}
+
+
+class SlidingWindowLimiter:
+    """Sliding-window counter approximated from two fixed windows.
+
+    Each key stores only the index of its current window and the counts for
+    that window and the previous one. The request rate is estimated as
+    ``previous * (1 - elapsed_fraction) + current``. Keys live in an
+    ``OrderedDict`` used as an LRU. Once ``max_keys`` are tracked, the least
+    recently seen key is evicted, so memory stays bounded under scans from
+    many addresses.
+    """
+
+    def __init__(self, limit: int, window_seconds: float, max_keys: int = MAX_TRACKED_KEYS):
+        self.limit = limit
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self._counters: OrderedDict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        """Count one request for ``key``; False if it is over the limit."""
+        now = time.time() if now is None else now
+        window_index, offset = divmod(now, self.window)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = [window_index, 0, 0]
+                self._counters[key] = counter
+                if len(self._counters) > self.max_keys:
+                    self._counters.popitem(last=False)
+            else:
+                self._counters.move_to_end(key)
+                if counter[0] != window_index:
+                    # Slide forward; anything older than one window no longer counts.
+                    counter[1] = counter[2] if window_index - counter[0] == 1 else 0
+                    counter[2] = 0
+                    counter[0] = window_index
+
+            estimate = counter[1] * (1 - offset / self.window) + counter[2]
+            if estimate >= self.limit:
+                return False
+            counter[2] += 1
+            return True
+
+
+class RateLimitBackend:
+    """Counts requests per (route, key) against ``limits``."""
+
+    def __init__(self, limits: Dict[str, RateLimit] = ROUTE_LIMITS) -> None:
+        self.limits = limits
+
+    def hit(self, route: str, key: str, now: Optional[float] = None) -> bool:
+        """Count one request; False if ``key`` is over the route's limit."""
+        raise NotImplementedError
+
+    def tracked_keys(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def retry_after(self, route: str, now: Optional[float] = None) -> int:
+        """Seconds until the route's current fixed window rolls over."""
+        window = self.limits[route].window_seconds
+        now = time.time() if now is None else now
+        return max(1, int(window - now % window))
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, limits: Dict[str, RateLimit] = ROUTE_LIMITS) -> None:
+        super().__init__(limits)
+        self._limiters = {
+            route: SlidingWindowLimiter(limit.limit, limit.window_seconds)
+            for route, limit in limits.items()
+        }
+
+    def hit(self, route: str, key: str, now: Optional[float] = None) -> bool:
+        return self._limiters[route].hit(key, now)
+
+    def tracked_keys(self) -> Dict[str, int]:
+        return {route: len(limiter) for route, limiter in self._limiters.items()}
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """The same sliding-window counter, stored in a SQLite file shared by workers.
+
+    Each hit is one autocommitted ``INSERT ... ON CONFLICT DO UPDATE ...
+    RETURNING`` statement. It slides the window, decides, and increments
+    atomically, so concurrent workers never lose or double-count a hit.
+    Rows carry an ``expires_at`` two windows out. A process deletes expired
+    rows in one batched DELETE at most every ``EXPIRY_INTERVAL_SECONDS``,
+    never per request.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            route TEXT NOT NULL,
+            key TEXT NOT NULL,
+            window_index INTEGER NOT NULL,
+            prev_count INTEGER NOT NULL,
+            curr_count INTEGER NOT NULL,
+            allowed INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (route, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS ix_rate_limits_expires_at ON rate_limits (expires_at);
+    """
+
+    # Each CASE reads the row as it was before this statement. The request is
+    # allowed when prev * weight + curr, after sliding into the current
+    # window, is still under the limit; only allowed requests are counted.
+    UPSERT = """
+        INSERT INTO rate_limits
+            (route, key, window_index, prev_count, curr_count, allowed, expires_at)
+        VALUES (:route, :key, :window, 0, :first, :first, :expires_at)
+        ON CONFLICT (route, key) DO UPDATE SET
+            allowed = CASE
+                WHEN window_index = :window THEN prev_count * :weight + curr_count < :limit
+                WHEN window_index = :window - 1 THEN curr_count * :weight < :limit
+                ELSE :first
+            END,
+            curr_count = CASE
+                WHEN window_index = :window
+                    THEN curr_count + (prev_count * :weight + curr_count < :limit)
+                WHEN window_index = :window - 1 THEN curr_count * :weight < :limit
+                ELSE :first
+            END,
+            prev_count = CASE
+                WHEN window_index = :window THEN prev_count
+                WHEN window_index = :window - 1 THEN curr_count
+                ELSE 0
+            END,
+            window_index = :window,
+            expires_at = :expires_at
+        RETURNING allowed
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB, limits: Dict[str, RateLimit] = ROUTE_LIMITS):
+        super().__init__(limits)
+        self.path = path
+        self._local = threading.local()
+        self._next_expiry = 0.0
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False, timeout=5
+            )
+            for pragma, value in SQLITE_PRAGMAS:
+                connection.execute(f"PRAGMA {pragma}={value}")
+            self._local.connection = connection
+        return connection
+
+    def hit(self, route: str, key: str, now: Optional[float] = None) -> bool:
+        limit = self.limits[route]
+        now = time.time() if now is None else now
+        window_index, offset = divmod(now, limit.window_seconds)
+        connection = self._connection()
+        if now >= self._next_expiry:
+            self._next_expiry = now + EXPIRY_INTERVAL_SECONDS
+            connection.execute("DELETE FROM rate_limits WHERE expires_at < ?", (now,))
+        (allowed,) = connection.execute(
+            self.UPSERT,
+            {
+                "route": route,
+                "key": key,
+                "window": int(window_index),
+                "weight": 1 - offset / limit.window_seconds,
+                "limit": limit.limit,
+                "first": int(limit.limit > 0),
+                "expires_at": (window_index + 2) * limit.window_seconds,
+            },
+        ).fetchone()
+        return bool(allowed)
+
+    def tracked_keys(self) -> Dict[str, int]:
+        rows = self._connection().execute(
+            "SELECT route, COUNT(*) FROM rate_limits GROUP BY route"
+        ).fetchall()
+        return {route: 0 for route in self.limits} | dict(rows)
+
+
+def build_backend(
+    name: str = RATE_LIMIT_BACKEND, limits: Dict[str, RateLimit] = ROUTE_LIMITS
+) -> RateLimitBackend:
+    if name == "memory":
+        return MemoryRateLimitBackend(limits)
+    if name == "sqlite":
+        return SQLiteRateLimitBackend(RATE_LIMIT_DB, limits)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {name!r}; expected 'memory' or 'sqlite'")
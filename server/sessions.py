@@ -0,0 +1,92 @@
+"""Refresh sessions: one row per signed-in device.
+
+Refresh tokens carry the session id (``sid``) and are stored only as a
+SHA-256 hash. Rotation, revocation and expiry are indexed statements on
+``refresh_sessions``, so none of them write the ``users`` row.
+"""
+
+from __future__ import annotations
+
+import secrets
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from .models import RefreshSession
+from .tokens import hash_token
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def open_session(
+    db: Session,
+    session_id: str,
+    user_id: int,
+    token: str,
+    expires_at: datetime,
+    user_agent: Optional[str] = None,
+    ip_address: Optional[str] = None,
+) -> None:
+    now = datetime.utcnow()
+    db.add(
+        RefreshSession(
+            id=session_id,
+            user_id=user_id,
+            token_hash=hash_token(token),
+            user_agent=(user_agent or "")[:255] or None,
+            ip_address=ip_address,
+            created_at=now,
+            last_used_at=now,
+            expires_at=expires_at,
+        )
+    )
+    db.commit()
+
+
+def rotate_session(
+    db: Session, session_id: str, token: str, new_token: str, expires_at: datetime
+) -> Optional[int]:
+    """Swap ``token`` for ``new_token`` and return the user id, or None if rejected.
+
+    A live session presented with a token other than its current one means
+    an old refresh token was replayed, so the session is ended.
+    """
+    now = datetime.utcnow()
+    row = db.execute(
+        update(RefreshSession)
+        .where(
+            RefreshSession.id == session_id,
+            RefreshSession.token_hash == hash_token(token),
+            RefreshSession.expires_at > now,
+        )
+        .values(token_hash=hash_token(new_token), last_used_at=now, expires_at=expires_at)
+        .returning(RefreshSession.user_id)
+    ).first()
+    if row is None:
+        db.execute(delete(RefreshSession).where(RefreshSession.id == session_id))
+    db.commit()
+    return row.user_id if row else None
+
+
+def revoke_session(db: Session, session_id: str) -> int:
+    result = db.execute(delete(RefreshSession).where(RefreshSession.id == session_id))
+    db.commit()
+    return result.rowcount
+
+
+def revoke_user_sessions(db: Session, user_id: int) -> int:
+    """End every session of ``user_id`` in one statement."""
+    result = db.execute(delete(RefreshSession).where(RefreshSession.user_id == user_id))
+    db.commit()
+    return result.rowcount
+
+
+def purge_expired_sessions(db: Session, now: Optional[datetime] = None) -> int:
+    cutoff = now or datetime.utcnow()
+    result = db.execute(delete(RefreshSession).where(RefreshSession.expires_at < cutoff))
+    db.commit()
+    return result.rowcount
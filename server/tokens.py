@@ -0,0 +1,118 @@
+"""Database-backed email tokens and the background purge of expired rows."""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import EmailToken
+
+PURGE_INTERVAL_SECONDS = float(os.getenv("AUTH_PURGE_SECONDS", "600"))
+
+logger = logging.getLogger(__name__)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class EmailTokenStore:
+    """Issues and redeems single-use tokens for one purpose.
+
+    Only the SHA-256 of a token is stored. Redeeming is a single
+    ``DELETE ... RETURNING``, so a token can be used once even when two
+    workers receive it at the same time.
+    """
+
+    def __init__(self, purpose: str) -> None:
+        self.purpose = purpose
+
+    def issue(self, db: Session, email: str, ttl_seconds: int) -> str:
+        token = secrets.token_urlsafe(32)
+        db.add(
+            EmailToken(
+                token_hash=hash_token(token),
+                purpose=self.purpose,
+                email=email,
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds),
+            )
+        )
+        db.commit()
+        return token
+
+    def redeem(self, db: Session, token: str) -> Optional[Tuple[str, datetime]]:
+        """Delete the token and return ``(email, expires_at)``, or None if unknown."""
+        row = db.execute(
+            delete(EmailToken)
+            .where(
+                EmailToken.token_hash == hash_token(token),
+                EmailToken.purpose == self.purpose,
+            )
+            .returning(EmailToken.email, EmailToken.expires_at)
+        ).first()
+        db.commit()
+        return tuple(row) if row else None
+
+
+def purge_expired_tokens(db: Session, now: Optional[datetime] = None) -> int:
+    cutoff = now or datetime.utcnow()
+    result = db.execute(delete(EmailToken).where(EmailToken.expires_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+
+class ExpiryPurger:
+    """Runs bulk purges of expired auth rows on a daemon thread at a fixed interval."""
+
+    def __init__(
+        self,
+        purges: Iterable[Callable[[Session], int]],
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval: float = PURGE_INTERVAL_SECONDS,
+    ) -> None:
+        self.purges = tuple(purges)
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="auth-purger", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def purge(self) -> int:
+        db = self.session_factory()
+        try:
+            return sum(purge(db) for purge in self.purges)
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                removed = self.purge()
+                if removed:
+                    logger.info("Purged %d expired auth rows", removed)
+            except Exception:
+                logger.exception("Auth purge failed")
+            if self._stop.wait(self.interval):
+                return
+
@@ -1,8 +1,10 @@
+import json
 import os
 
 import pytest
 
 from fieldflux.app import FieldFluxApp, PermissionError
+from fieldflux.telemetry import ErrorMonitor, EventLogger, NdjsonFileSink
 
 
 @pytest.fixture
@@ -90,3 +92,68 @@ def test_telemetry_captures_events(app):
     instance, admin, *_ = app
     instance.create_field(admin, name="Telemetry", crop="Corn")
     assert any(event.get("event") == "field_created" for event in instance.logger.events)
+
+
+def test_event_buffer_is_bounded_and_counts_drops():
+    events = EventLogger(capacity=3)
+    for index in range(5):
+        events.capture("field_viewed", {"index": index})
+
+    assert [event["index"] for event in events.events] == [2, 3, 4]
+    assert events.dropped == 2
+
+
+def test_events_are_flushed_to_ndjson_in_batches(tmp_path):
+    path = tmp_path / "events.ndjson"
+    events = EventLogger(
+        capacity=100, sink=NdjsonFileSink(path), batch_size=2, flush_interval=60
+    )
+    instance = FieldFluxApp(logger=events)
+    instance.register_user("alice", "admin")
+    instance.authenticate("alice")
+    instance.authenticate("alice")
+    events.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["event"] for line in lines] == [
+        "user_registered",
+        "user_authenticated",
+        "user_authenticated",
+    ]
+    assert events.events == [] and events.dropped == 0
+
+
+def test_error_monitor_groups_repeats_and_samples_exemplars():
+    monitor = ErrorMonitor(max_exemplars=3, max_groups=2)
+    instance = FieldFluxApp(error_monitor=monitor)
+    viewer = instance.register_user("victor", "viewer")
+    for _ in range(1000):
+        with pytest.raises(KeyError):
+            instance.get_field(viewer, "missing")
+    with pytest.raises(PermissionError):
+        instance.create_field(viewer, name="Plot", crop="Corn")
+    with pytest.raises(PermissionError):
+        instance.delete_field(viewer, "missing")
+
+    summary = monitor.summary()
+    assert monitor.total == 1002
+    # Two groups fit; the oldest (read_missing_field) was evicted by the second denial.
+    assert monitor.evicted_groups == 1
+    assert [group["fingerprint"] for group in summary] == [
+        "permission_denied[action=create]",
+        "permission_denied[action=delete]",
+    ]
+
+
+def test_error_group_counts_are_exact_while_exemplars_stay_bounded():
+    monitor = ErrorMonitor(max_exemplars=3)
+    for index in range(1000):
+        monitor.capture_error("read_missing_field", {"field_id": f"f{index % 7}"})
+
+    (group,) = monitor.summary()
+    assert group["count"] == 1000
+    assert group["first_seen"] <= group["last_seen"]
+    assert len(group["exemplars"]) == 3
+    assert monitor.group("read_missing_field").count == 1000
+    # Only payloads kept as exemplars are forwarded to the buffer.
+    assert 3 <= len(monitor.errors) < 100
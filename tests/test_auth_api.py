@@ -1,8 +1,76 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import pytest
 from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from sqlalchemy import event, select
+from sqlalchemy.orm import sessionmaker
 
-from server import main
+from fieldflux.db import create_sqlite_engine
+from server import auth, main
+from server.database import Base, get_db
+from server.hashing import HashingOverloaded, PasswordHasher
+from server.models import EmailToken, RefreshSession, User
+from server.principals import PrincipalCache
+from server.ratelimit import (
+    ROUTE_LIMITS,
+    MemoryRateLimitBackend,
+    RateLimit,
+    SlidingWindowLimiter,
+    SQLiteRateLimitBackend,
+)
+from server.sessions import purge_expired_sessions
+from server.tokens import purge_expired_tokens
+
+FAST_HASHING = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'auth.db'}", name="auth-test")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    TestingSession = sessionmaker(bind=engine)
+
+    def override_db():
+        with TestingSession() as db:
+            yield db
+
+    monkeypatch.setattr(auth, "rate_limiter", MemoryRateLimitBackend())
+    monkeypatch.setattr(auth, "password_hasher", PasswordHasher(FAST_HASHING, workers=2))
+    monkeypatch.setattr(auth, "principal_cache", PrincipalCache())
+    main.app.dependency_overrides[get_db] = override_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def _signup(client, email="ada@example.com", password="correct-horse"):
+    response = client.post("/signup", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _login(client, email="ada@example.com", password="correct-horse"):
+    response = client.post("/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _user_queries(engine):
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, sql, *args: statements.append(sql) if "users" in sql else None,
+    )
+    return statements
 
 
 def test_health_endpoint_runs_and_cleans_up_db():
@@ -12,8 +80,258 @@ def test_health_endpoint_runs_and_cleans_up_db():
         response = client.get("/health")
 
     assert response.status_code == 200
-    assert response.json().get("status") == "ok"
+    assert response.json() == {"status": "ok"}
 
     for db_file in db_files:
         db_file.unlink(missing_ok=True)
 
+
+def test_sliding_window_limiter_weights_previous_window_and_evicts_lru():
+    limiter = SlidingWindowLimiter(limit=4, window_seconds=10, max_keys=2)
+
+    assert all(limiter.hit("a", now=t) for t in (1, 2, 3, 4))
+    assert not limiter.hit("a", now=5)
+    # Halfway through the next window half of the previous four still count.
+    assert all(limiter.hit("a", now=t) for t in (15, 15.5, 16))
+    assert not limiter.hit("a", now=16.5)
+    assert limiter.hit("a", now=35)
+
+    limiter.hit("b", now=35)
+    limiter.hit("a", now=36)
+    limiter.hit("c", now=36)
+    assert len(limiter) == 2
+    assert set(limiter._counters) == {"a", "c"}
+
+
+def test_login_is_rate_limited_per_route(client, monkeypatch):
+    monkeypatch.setattr(
+        auth, "rate_limiter", MemoryRateLimitBackend({**ROUTE_LIMITS, "login": RateLimit(2, 60)})
+    )
+    credentials = {"email": "ada@example.com", "password": "wrong-password"}
+    codes = [client.post("/login", json=credentials).status_code for _ in range(3)]
+    reset = client.post("/password-reset/request", json={"email": "ada@example.com"})
+
+    assert codes == [401, 401, 429]
+    assert reset.status_code == 200
+
+
+def test_sqlite_backend_shares_counters_and_expires_in_batches(tmp_path, monkeypatch):
+    path = str(tmp_path / "ratelimit.db")
+    limits = {"login": RateLimit(limit=4, window_seconds=10)}
+    worker_a = SQLiteRateLimitBackend(path, limits)
+    worker_b = SQLiteRateLimitBackend(path, limits)
+    memory = MemoryRateLimitBackend(limits)
+
+    timeline = [1, 2, 3, 4, 5, 15, 15.5, 16, 16.5, 35]
+    shared = [
+        (worker_a if i % 2 else worker_b).hit("login", "10.0.0.1", now=t)
+        for i, t in enumerate(timeline)
+    ]
+    assert shared == [memory.hit("login", "10.0.0.1", now=t) for t in timeline]
+    assert worker_b.hit("login", "10.0.0.2", now=35)
+    assert worker_a.tracked_keys() == {"login": 2}
+
+    monkeypatch.setattr(worker_a, "_next_expiry", 0.0)
+    worker_a.hit("login", "10.0.0.3", now=60)
+    assert worker_b.tracked_keys() == {"login": 1}
+
+
+def test_login_upgrades_hashes_made_with_an_old_cost(client, engine, monkeypatch):
+    _signup(client)
+    stronger = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5)
+    monkeypatch.setattr(auth, "password_hasher", PasswordHasher(stronger, workers=1))
+
+    assert client.post(
+        "/login", json={"email": "ada@example.com", "password": "nope-nope"}
+    ).status_code == 401
+    response = client.post(
+        "/login", json={"email": "ada@example.com", "password": "correct-horse"}
+    )
+
+    assert response.status_code == 200
+    with sessionmaker(bind=engine)() as db:
+        stored = db.query(User).one().password_hash
+    assert stored.startswith("$2b$05$")
+    assert stronger.verify("correct-horse", stored)
+
+
+def test_hash_executor_sheds_load_when_saturated(client, monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+
+    class SlowContext:
+        def hash(self, password):
+            started.set()
+            release.wait(5)
+            return FAST_HASHING.hash(password)
+
+    hasher = PasswordHasher(SlowContext(), workers=1, max_pending=1)
+    worker = threading.Thread(target=asyncio.run, args=(hasher.hash("first-password"),))
+    worker.start()
+    started.wait(5)
+    try:
+        assert hasher.queue_depth == 1
+        with pytest.raises(HashingOverloaded):
+            asyncio.run(hasher.hash("second-password"))
+        monkeypatch.setattr(auth, "password_hasher", hasher)
+        response = client.post(
+            "/signup", json={"email": "bob@example.com", "password": "correct-horse"}
+        )
+    finally:
+        release.set()
+        worker.join()
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert (hasher.queue_depth, hasher.rejected) == (0, 2)
+
+
+def test_me_is_served_from_the_principal_cache_until_logout(client, engine):
+    _signup(client)
+    tokens = _login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/me", headers=headers).json()["email"] == "ada@example.com"
+
+    statements = _user_queries(engine)
+    profile = client.get("/me", headers=headers).json()
+    assert profile["email"] == "ada@example.com"
+    assert statements == []
+    assert len(auth.principal_cache) == 1
+
+    assert client.post("/logout", headers=headers).status_code == 200
+    assert len(auth.principal_cache) == 0
+    with sessionmaker(bind=engine)() as db:
+        assert db.query(RefreshSession).count() == 0
+
+
+def test_principal_cache_respects_token_expiry_and_size():
+    cache = PrincipalCache(ttl_seconds=30, max_size=2)
+    user = User(id=1, email="ada@example.com", is_verified=False)
+
+    cache.put("short", user, {"sub": "1", "exp": 110}, now=100)
+    cache.put("long", user, {"sub": "1", "exp": 1000}, now=100)
+    assert cache.get("short", now=105).user_id == 1
+    assert cache.get("short", now=111) is None
+    assert cache.get("long", now=129) is not None
+    assert cache.get("long", now=131) is None
+
+    for token in ("a", "b", "c"):
+        cache.put(token, User(id=2, email="bob@example.com"), {"exp": 1000}, now=200)
+    assert len(cache) == 2
+    assert cache.get("a", now=201) is None
+    cache.invalidate_user(2)
+    assert len(cache) == 0
+
+
+def test_refresh_rotation_evicts_cached_principals(client):
+    _signup(client)
+    tokens = _login(client)
+    client.get("/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert len(auth.principal_cache) == 1
+
+    rotated = client.post("/token/refresh", params={"token": tokens["refresh_token"]})
+
+    assert rotated.status_code == 200
+    assert len(auth.principal_cache) == 0
+
+
+def test_email_tokens_are_stored_hashed_single_use_and_purged(client, engine):
+    _signup(client)
+    with sessionmaker(bind=engine)() as db:
+        token = auth.create_email_token(db, "ada@example.com", auth.verification_tokens)
+        stale = auth.create_email_token(
+            db, "ada@example.com", auth.password_reset_tokens, ttl_seconds=-1
+        )
+        stored = db.scalars(select(EmailToken.token_hash)).all()
+    assert token not in stored and stale not in stored
+
+    assert client.post("/verify-email/confirm", json={"token": token}).status_code == 200
+    replay = client.post("/verify-email/confirm", json={"token": token})
+    assert replay.status_code == 400
+    # A verification token cannot be redeemed as a reset token.
+    with sessionmaker(bind=engine)() as db:
+        other = auth.create_email_token(db, "ada@example.com", auth.verification_tokens)
+    wrong = client.post(
+        "/password-reset/confirm", json={"token": other, "new_password": "battery-staple"}
+    )
+    assert wrong.status_code == 400
+
+    with sessionmaker(bind=engine)() as db:
+        assert purge_expired_tokens(db) == 1
+        # The signup verification token and the unredeemed one are still live.
+        assert purge_expired_tokens(db, now=datetime.utcnow() + timedelta(hours=2)) == 2
+        assert db.scalars(select(EmailToken)).all() == []
+
+
+def test_sessions_are_per_device_rotated_and_revoked_in_bulk(client, engine):
+    _signup(client)
+    phone = _login(client)
+    tablet = _login(client)
+
+    rotated = client.post("/token/refresh", params={"token": phone["refresh_token"]})
+    assert rotated.status_code == 200
+    # Replaying the old token ends the phone's session, not the tablet's.
+    replay = client.post("/token/refresh", params={"token": phone["refresh_token"]})
+    assert replay.status_code == 401
+    reuse = client.post("/token/refresh", params={"token": rotated.json()["refresh_token"]})
+    assert reuse.status_code == 401
+    tablet = client.post("/token/refresh", params={"token": tablet["refresh_token"]}).json()
+
+    laptop = _login(client)
+    headers = {"Authorization": f"Bearer {laptop['access_token']}"}
+    assert client.post("/logout", headers=headers).status_code == 200
+    with sessionmaker(bind=engine)() as db:
+        assert db.query(RefreshSession).count() == 1
+
+    _login(client)
+    headers = {"Authorization": f"Bearer {tablet['access_token']}"}
+    everywhere = client.post("/logout/all", headers=headers)
+    assert everywhere.json()["sessions_revoked"] == 2
+    stale = client.post("/token/refresh", params={"token": tablet["refresh_token"]})
+    assert stale.status_code == 401
+
+
+def test_expired_sessions_are_purged(client, engine):
+    _signup(client)
+    _login(client)
+    with sessionmaker(bind=engine)() as db:
+        assert purge_expired_sessions(db) == 0
+        later = datetime.utcnow() + timedelta(days=auth.REFRESH_TOKEN_EXPIRE_DAYS + 1)
+        assert purge_expired_sessions(db, now=later) == 1
+
+
+def test_metrics_endpoint_exposes_requests_rejections_and_hashing(client, monkeypatch):
+    monkeypatch.setattr(
+        auth, "rate_limiter", MemoryRateLimitBackend({**ROUTE_LIMITS, "login": RateLimit(1, 60)})
+    )
+    before = auth.RATE_LIMIT_REJECTIONS.value("login")
+    _signup(client)
+    _login(client)
+    rejected = client.post("/login", json={"email": "x@example.com", "password": "x"})
+    assert rejected.status_code == 429
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert auth.RATE_LIMIT_REJECTIONS.value("login") == before + 1
+    login = 'app="auth",method="POST",route="/login"'
+    assert f'fieldflux_http_requests_total{{{login},status="429"}}' in text
+    assert f"fieldflux_http_request_duration_seconds_count{{{login}}}" in text
+    assert "fieldflux_auth_hash_queue_depth 0" in text
+    assert "fieldflux_auth_hash_duration_seconds_count 2" in text
+    assert 'fieldflux_db_pool_connections{database="auth-test",state="size"}' in text
+
+
+def test_confirming_email_evicts_the_cached_principal(client, engine):
+    _signup(client)
+    tokens = _login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/me", headers=headers).json()["is_verified"] is False
+
+    with sessionmaker(bind=engine)() as db:
+        token = auth.create_email_token(db, "ada@example.com", auth.verification_tokens)
+    assert client.post("/verify-email/confirm", json={"token": token}).status_code == 200
+
+    assert client.get("/me", headers=headers).json()["is_verified"] is True
@@ -0,0 +1,531 @@
+import io
+import zipfile
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import billing, main, models, money, reconciliation, rendering
+from backend.app.database import Base, BillingSession, get_db
+from backend.app.recompute import recompute_invoice_totals
+from backend.app.sweeper import OverdueSweeper
+from fieldflux.db import create_sqlite_engine, migrate_schema
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'billing.db'}", name="billing-test")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def client(engine):
+    TestingSession = sessionmaker(
+        autocommit=False, autoflush=False, bind=engine, class_=BillingSession
+    )
+
+    def override_db():
+        db = TestingSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[get_db] = override_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def render_cache(tmp_path, monkeypatch):
+    cache = rendering.InvoiceRenderCache(tmp_path / "renders")
+    monkeypatch.setattr(rendering, "render_cache", cache)
+    yield cache
+    rendering.shutdown_pdf_executor()
+
+
+def _farmer(client, name="Ada"):
+    return client.post("/farmers", json={"name": name}).json()
+
+
+def _invoice(client, farmer_id, **overrides):
+    payload = {
+        "farmer_id": farmer_id,
+        "line_items": [{"description": "Nitrogen pass", "quantity": 2, "unit_price": 50}],
+        **overrides,
+    }
+    response = client.post("/invoices", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _count_queries(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_list_invoices_query_count_is_constant(client, engine):
+    farmer = _farmer(client)
+    field = client.post("/fields", json={"name": "North", "farmer_id": farmer["id"]}).json()
+    for _ in range(3):
+        invoice = _invoice(client, farmer["id"], field_id=field["id"])
+        client.post(f"/invoices/{invoice['id']}/payments", json={"amount": 10})
+
+    statements = _count_queries(engine)
+    small = client.get("/invoices", params={"limit": 1})
+    small_count = len(statements)
+    statements.clear()
+    full = client.get("/invoices")
+
+    assert len(small.json()) == 1
+    assert len(full.json()) == 3
+    assert len(statements) == small_count
+    assert full.json()[0]["payments"][0]["amount"] == 10
+
+
+def test_list_invoices_keyset_pagination_and_filters(client):
+    ada, bob = _farmer(client, "Ada"), _farmer(client, "Bob")
+    first = _invoice(client, ada["id"], issue_date="2024-03-01")
+    _invoice(client, bob["id"], issue_date="2024-03-05")
+    third = _invoice(client, ada["id"], issue_date="2024-04-01", status="sent")
+
+    page = client.get("/invoices", params={"farmer_id": ada["id"], "limit": 1})
+    assert [inv["id"] for inv in page.json()] == [first["id"]]
+    cursor = page.headers["X-Next-Cursor"]
+
+    page = client.get(
+        "/invoices", params={"farmer_id": ada["id"], "limit": 1, "after_id": cursor}
+    )
+    assert [inv["id"] for inv in page.json()] == [third["id"]]
+    assert "X-Next-Cursor" not in page.headers
+
+    march = client.get("/invoices", params={"from": "2024-03-01", "to": "2024-03-31"}).json()
+    assert [inv["farmer"]["name"] for inv in march] == ["Ada", "Bob"]
+    sent = client.get("/invoices", params={"status": "sent"}).json()
+    assert [inv["id"] for inv in sent] == [third["id"]]
+
+
+def test_reads_are_side_effect_free_and_sweeper_marks_overdue(client, engine):
+    farmer = _farmer(client)
+    invoice = _invoice(client, farmer["id"], status="sent", due_date="2020-01-01")
+    assert invoice["total"] == 100.0
+
+    assert client.get(f"/invoices/{invoice['id']}").json()["status"] == "sent"
+    statements = _count_queries(engine)
+    client.get("/invoices")
+    assert not [sql for sql in statements if sql.lstrip().upper().startswith("UPDATE")]
+
+    sweeper = OverdueSweeper(session_factory=sessionmaker(bind=engine, class_=BillingSession))
+    assert sweeper.sweep() == 1
+    assert client.get(f"/invoices/{invoice['id']}").json()["status"] == "overdue"
+    assert sweeper.sweep() == 0
+
+
+def test_balances_and_aging_are_aggregated_per_farmer(client):
+    ada, bob = _farmer(client, "Ada"), _farmer(client, "Bob")
+    current = _invoice(client, ada["id"], status="sent", due_date="2024-06-20")
+    late = _invoice(client, ada["id"], status="overdue", due_date="2024-03-01")
+    _invoice(client, bob["id"], status="sent", due_date="2024-05-10")
+    client.post(f"/invoices/{current['id']}/payments", json={"amount": 40})
+    client.post(f"/invoices/{late['id']}/payments", json={"amount": 25})
+
+    assert client.get(f"/farmers/{ada['id']}/balance").json() == {
+        "farmer_id": ada["id"],
+        "outstanding_balance": 135.0,
+    }
+    assert client.get("/farmers/999/balance").status_code == 404
+    balances = client.get("/farmers/balances").json()
+    assert [(b["name"], b["billed"], b["paid"]) for b in balances] == [
+        ("Ada", 200.0, 65.0),
+        ("Bob", 100.0, 0.0),
+    ]
+
+    aging = client.get("/reports/aging", params={"as_of": "2024-07-01"}).json()
+    assert aging == [
+        {
+            "farmer_id": ada["id"],
+            "name": "Ada",
+            "days_0_30": 60.0,
+            "days_31_60": 0.0,
+            "days_61_90": 0.0,
+            "days_over_90": 75.0,
+            "total": 135.0,
+        },
+        {
+            "farmer_id": bob["id"],
+            "name": "Bob",
+            "days_0_30": 0.0,
+            "days_31_60": 100.0,
+            "days_61_90": 0.0,
+            "days_over_90": 0.0,
+            "total": 100.0,
+        },
+    ]
+
+
+def test_ledger_totals_are_summed_in_cents(client):
+    farmer = _farmer(client)
+    invoice = _invoice(
+        client,
+        farmer["id"],
+        status="sent",
+        line_items=[{"description": "Scouting", "quantity": 1, "unit_price": 0.3}],
+    )
+    for _ in range(3):
+        client.post(f"/invoices/{invoice['id']}/payments", json={"amount": 0.1})
+
+    [balance] = client.get("/farmers/balances").json()
+    assert (balance["billed"], balance["paid"]) == (0.3, 0.3)
+    assert balance["outstanding_balance"] == 0
+    assert client.get("/invoices/stats").json()["total"] == 0.3
+
+
+def test_billing_run_prices_applications_and_is_idempotent(client):
+    ada, bob = _farmer(client, "Ada"), _farmer(client, "Bob")
+    north = client.post("/fields", json={"name": "North", "farmer_id": ada["id"]}).json()
+    south = client.post("/fields", json={"name": "South", "farmer_id": ada["id"]}).json()
+    east = client.post("/fields", json={"name": "East", "farmer_id": bob["id"]}).json()
+    applications = [
+        {"field_id": field["id"], "product": product, "quantity": qty, "applied_on": applied_on}
+        for field, product, qty, applied_on in [
+            (north, "Urea", 2, "2024-04-02"),
+            (south, "urea", 1, "2024-05-10"),
+            (east, "Glyphosate", 3, "2024-06-01"),
+            (east, "Mystery", 1, "2024-06-02"),
+            (east, "Urea", 1, "2023-06-02"),
+        ]
+    ]
+    assert client.post("/field-applications", json=applications).status_code == 200
+
+    request = {
+        "start_date": "2024-01-01",
+        "end_date": "2024-12-31",
+        "prices": {"Urea": 40.0, "Glyphosate": 12.5},
+    }
+    run = client.post("/billing-runs", json=request)
+    assert run.status_code == 202
+    run = client.get(f"/billing-runs/{run.json()['id']}").json()
+    assert run["status"] == "completed"
+    counts = (run["invoices_created"], run["line_items_created"], run["skipped_unpriced"])
+    assert counts == (2, 3, 1)
+
+    invoices = {inv["farmer"]["name"]: inv for inv in client.get("/invoices").json()}
+    assert invoices["Ada"]["total"] == 120.0
+    assert invoices["Bob"]["total"] == 37.5
+    assert invoices["Bob"]["line_items"][0]["billable_reference"].startswith("application:")
+
+    rerun = client.post("/billing-runs", json=request).json()
+    rerun = client.get(f"/billing-runs/{rerun['id']}").json()
+    assert (rerun["status"], rerun["invoices_created"]) == ("completed", 0)
+    assert len(client.get("/invoices").json()) == 2
+
+
+def test_stuck_billing_run_blocks_new_runs_until_its_heartbeat_goes_stale(client, engine):
+    request = {"start_date": "2024-01-01", "end_date": "2024-12-31", "prices": {}}
+    Session = sessionmaker(bind=engine, class_=BillingSession)
+    with Session() as db:
+        stuck = models.BillingRun(
+            status=models.BillingRunStatus.running,
+            period_start=date(2024, 1, 1),
+            period_end=date(2024, 12, 31),
+        )
+        db.add(stuck)
+        db.commit()
+        stuck_id = stuck.id
+
+    assert client.post("/billing-runs", json=request).status_code == 409
+    with Session() as db, pytest.raises(IntegrityError):
+        # The database itself refuses a second active run, whoever inserts it.
+        db.add(models.BillingRun(period_start=date(2024, 1, 1), period_end=date(2024, 1, 2)))
+        db.commit()
+
+    with Session() as db:
+        stale = datetime.utcnow() - timedelta(seconds=billing.STALE_RUN_SECONDS + 1)
+        db.get(models.BillingRun, stuck_id).heartbeat_at = stale
+        db.commit()
+
+    response = client.post("/billing-runs", json=request)
+    assert response.status_code == 202
+    assert client.get(f"/billing-runs/{response.json()['id']}").json()["status"] == "completed"
+    stuck = client.get(f"/billing-runs/{stuck_id}").json()
+    assert stuck["status"] == "failed"
+    assert "heartbeat" in stuck["error"]
+
+
+def test_invoice_pdf_is_cached_per_revision(client, engine, render_cache):
+    invoice = _invoice(client, _farmer(client)["id"])
+    url = f"/invoices/{invoice['id']}/pdf"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/pdf"
+    assert first.content.startswith(b"%PDF")
+    [cached] = render_cache.directory.glob("*.pdf")
+    mtime = cached.stat().st_mtime_ns
+    statements = _count_queries(engine)
+    assert client.get(url).content == first.content
+    assert cached.stat().st_mtime_ns == mtime
+    # A hit only looks up the revision.
+    assert len(statements) == 1
+
+    client.post(f"/invoices/{invoice['id']}/payments", json={"amount": 10})
+    client.get(url)
+    [refreshed] = render_cache.directory.glob("*.pdf")
+    assert refreshed != cached
+    assert client.get("/invoices/999/pdf").status_code == 404
+
+
+def test_export_zip_streams_filtered_invoice_pdfs(client, render_cache):
+    ada, bob = _farmer(client, "Ada"), _farmer(client, "Bob")
+    first = _invoice(client, ada["id"], issue_date="2024-03-01")
+    second = _invoice(client, ada["id"], issue_date="2024-04-01")
+    _invoice(client, ada["id"], issue_date="2025-01-01")
+    _invoice(client, bob["id"], issue_date="2024-03-15")
+    cached = client.get(f"/invoices/{first['id']}/pdf").content
+
+    response = client.get(
+        "/invoices/export.zip",
+        params={"farmer_id": ada["id"], "from": "2024-01-01", "to": "2024-12-31"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == [
+            f"invoice-{first['id']}.pdf",
+            f"invoice-{second['id']}.pdf",
+        ]
+        assert archive.read(f"invoice-{first['id']}.pdf") == cached
+        assert archive.read(f"invoice-{second['id']}.pdf").startswith(b"%PDF")
+    assert len(list(render_cache.directory.glob("*.pdf"))) == 2
+
+
+def test_invoice_html_escapes_input_and_is_cached_per_revision(client, render_cache):
+    farmer = _farmer(client, "<script>alert(1)</script>")
+    invoice = _invoice(client, farmer["id"], notes="Tom & Jerry")
+    url = f"/invoices/{invoice['id']}/html"
+
+    page = client.get(url)
+    assert page.status_code == 200
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in page.text
+    assert "<script>" not in page.text
+    assert "Tom &amp; Jerry" in page.text
+    assert "$100.00" in page.text
+    [cached] = render_cache.directory.glob("*.html")
+    assert client.get(url).text == page.text
+
+    client.post(f"/invoices/{invoice['id']}/payments", json={"amount": 40, "method": "ach"})
+    assert "via ach" in client.get(url).text
+    assert [path.name for path in render_cache.directory.glob("*.html")] != [cached.name]
+
+
+def test_farmer_statement_lists_open_invoices_only(client, engine):
+    farmer = _farmer(client)
+    _invoice(client, farmer["id"], status="sent")
+    _invoice(client, farmer["id"], status="overdue")
+    _invoice(client, farmer["id"])
+
+    queries = _count_queries(engine)
+    page = client.get(f"/farmers/{farmer['id']}/statement", params={"as_of": "2024-06-30"})
+    query_count = len(queries)
+    _invoice(client, farmer["id"], status="sent")
+    queries.clear()
+    client.get(f"/farmers/{farmer['id']}/statement")
+
+    assert page.status_code == 200
+    assert page.text.count("<section>") == 2
+    assert "Total Outstanding: $200.00" in page.text
+    assert "As of 2024-06-30" in page.text
+    assert len(queries) == query_count
+    assert client.get("/farmers/999/statement").status_code == 404
+
+
+def test_reconcile_bank_csv_applies_matches_and_reports_the_rest(client):
+    ada, bob = _farmer(client, "Ada"), _farmer(client, "Bob")
+    partial = _invoice(client, ada["id"], status="sent")
+    by_payer = _invoice(client, bob["id"], status="overdue")
+    draft = _invoice(client, ada["id"])
+    csv_body = "\n".join(
+        [
+            "Date,Reference,Amount,Payer",
+            f"2024-05-01,INV-{partial['id']},40.00,Ada",
+            "2024-05-01,BANK-7781,100.00,bob",
+            f"2024-05-02,INV-{partial['id']},60.00,",
+            f"2024-05-02,INV-{partial['id']},60.00,",
+            f"2024-05-02,INV-{draft['id']},10.00,Ada",
+            f"2024-05-03,{by_payer['id']},5.00,Ada",
+            "2024-05-03,,abc,Bob",
+        ]
+    )
+
+    def upload(body):
+        return client.post(
+            "/payments/reconcile", files={"statement": ("bank.csv", body, "text/csv")}
+        )
+
+    report = upload(csv_body).json()
+
+    assert (report["rows"], report["matched"], report["invoices_updated"]) == (7, 3, 2)
+    assert report["applied_total"] == 200.0
+    assert [(row["line"], row["reason"]) for row in report["unmatched"]] == [
+        (5, "duplicate payment"),
+        (6, "no open invoice for reference"),
+        (7, "payer does not match invoice farmer"),
+        (8, "invalid amount"),
+    ]
+    assert client.get(f"/invoices/{partial['id']}").json()["status"] == "paid"
+    assert client.get(f"/invoices/{by_payer['id']}").json()["status"] == "paid"
+
+    replay = upload(csv_body).json()
+    assert replay["matched"] == 0
+    assert client.get(f"/invoices/{partial['id']}").json()["payments"][0]["date"].startswith(
+        "2024-05-01"
+    )
+    assert upload("Amount\n1.00\n").status_code == 422
+
+
+def test_reconcile_rejects_malformed_rows_and_streams_in_chunks(client, monkeypatch):
+    monkeypatch.setattr(reconciliation, "LOOKUP_CHUNK_SIZE", 2)
+    ada = _farmer(client, "Ada")
+    invoice = _invoice(client, ada["id"], status="sent")
+    csv_body = "\n".join(
+        [
+            "Date,Reference,Amount,Payer",
+            f"2024-05-01,INV-{invoice['id']},inf,Ada",
+            f"2024-05-01,INV-{invoice['id']},nan,Ada",
+            f"2024-05-01,INV-{invoice['id']},1e999,Ada",
+            f"2024-05-01,INV-{invoice['id']},40.00,Ada,surplus",
+            f"2024-05-01,INV-{invoice['id']},\"$1,000.00\",Ada",
+            f"2024-05-01,INV-{invoice['id']},40.00,Ada",
+            f"2024-05-01,INV-{invoice['id']},40.00,Ada",
+            f"2024-05-02,INV-{invoice['id']},60.00,Ada",
+        ]
+    )
+
+    response = client.post(
+        "/payments/reconcile", files={"statement": ("bank.csv", csv_body, "text/csv")}
+    )
+
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["rows"], report["matched"], report["applied_total"]) == (8, 2, 100.0)
+    assert [(row["line"], row["reason"]) for row in report["unmatched"]] == [
+        (2, "invalid amount"),
+        (3, "invalid amount"),
+        (4, "invalid amount"),
+        (5, "more fields than the header"),
+        (6, "amount exceeds outstanding balance"),
+        (8, "duplicate payment"),
+    ]
+    assert client.get(f"/invoices/{invoice['id']}").json()["status"] == "paid"
+
+
+def test_invoice_stats_group_by_status_and_month(client):
+    ada, bob = _farmer(client, "Ada"), _farmer(client, "Bob")
+    _invoice(client, ada["id"], issue_date="2024-03-01", status="sent")
+    _invoice(client, ada["id"], issue_date="2024-03-20", status="sent")
+    _invoice(client, ada["id"], issue_date="2024-04-02", status="paid")
+    _invoice(client, bob["id"], issue_date="2024-04-10")
+
+    stats = client.get("/invoices/stats", params={"farmer_id": ada["id"]}).json()
+
+    assert (stats["count"], stats["total"]) == (3, 300.0)
+    assert stats["by_status"] == [
+        {"status": "paid", "count": 1, "total": 100.0},
+        {"status": "sent", "count": 2, "total": 200.0},
+    ]
+    assert stats["by_month"] == [
+        {"month": "2024-03", "count": 2, "total": 200.0},
+        {"month": "2024-04", "count": 1, "total": 100.0},
+    ]
+    april = client.get("/invoices/stats", params={"from": "2024-04-01"}).json()
+    assert [row["month"] for row in april["by_month"]] == ["2024-04"]
+    assert april["count"] == 2
+
+
+def test_money_rounds_per_line_in_integer_cents():
+    totals = money.invoice_totals(
+        [(3, 0.1, 0.0), (1, 19.99, 0.0825), (0.5, 0.05, 0.0)], tax_rate=0.05, discount_rate=0.1
+    )
+
+    assert (totals.subtotal, totals.line_tax, totals.tax, totals.discount) == (2032, 165, 102, 203)
+    assert totals.total == 2096
+    assert money.to_decimal(totals.total) == money.to_decimal(2096)
+    assert str(money.to_decimal(2096)) == "20.96"
+
+
+def test_invoice_totals_include_line_tax_and_batch_recompute(client, engine):
+    farmer = _farmer(client)
+    invoice = _invoice(
+        client,
+        farmer["id"],
+        tax_rate=0.1,
+        line_items=[
+            {"description": "Seed", "quantity": 3, "unit_price": 0.1, "tax_rate": 0.0},
+            {"description": "Spray", "quantity": 1, "unit_price": 10, "tax_rate": 0.05},
+        ],
+    )
+    assert (invoice["subtotal"], invoice["total"]) == (10.3, 11.83)
+    assert [item["line_total"] for item in invoice["line_items"]] == [0.3, 10.5]
+
+    client.post(f"/invoices/{invoice['id']}/payments", json={"amount": 11.83})
+    assert client.get(f"/invoices/{invoice['id']}").json()["outstanding_balance"] == 0
+
+    Session = sessionmaker(bind=engine, class_=BillingSession)
+    with Session() as db:
+        db.query(models.LineItem).filter_by(description="Spray").update({"tax_rate": 0.0})
+        db.commit()
+        revision = db.get(models.Invoice, invoice["id"]).revision
+
+    assert recompute_invoice_totals(Session, batch_size=1, dry_run=True).updated == 1
+    result = recompute_invoice_totals(Session, batch_size=1)
+    assert (result.scanned, result.updated) == (1, 1)
+    with Session() as db:
+        stored = db.get(models.Invoice, invoice["id"])
+        assert str(stored.total) == "11.33"
+        assert stored.revision == revision + 1
+    assert recompute_invoice_totals(Session).updated == 0
+
+
+def test_interleaved_payments_each_bump_the_invoice_revision(client, engine):
+    invoice = _invoice(client, _farmer(client)["id"])
+    Session = sessionmaker(bind=engine, class_=BillingSession)
+    with Session() as first, Session() as second:
+        loaded = [db.get(models.Invoice, invoice["id"]) for db in (first, second)]
+        assert [stored.revision for stored in loaded] == [0, 0]
+        for db, stored in zip((first, second), loaded, strict=True):
+            db.add(models.PaymentRecord(invoice=stored, amount=10))
+            db.commit()
+
+    with Session() as db:
+        assert db.get(models.Invoice, invoice["id"]).revision == 2
+
+
+def test_revision_hook_only_applies_to_billing_sessions(client, engine):
+    invoice = _invoice(client, _farmer(client)["id"])
+    with sessionmaker(bind=engine)() as db:
+        stored = db.get(models.Invoice, invoice["id"])
+        revision = stored.revision
+        stored.notes = "edited outside billing"
+        db.commit()
+        assert stored.revision == revision
+
+
+def test_startup_migration_adds_invoice_revision(client, engine):
+    invoice = _invoice(client, _farmer(client)["id"])
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE invoices DROP COLUMN revision")
+
+    applied = migrate_schema(engine, Base.metadata)
+
+    assert applied == ["ALTER TABLE invoices ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"]
+    assert migrate_schema(engine, Base.metadata) == []
+    response = client.patch(f"/invoices/{invoice['id']}/status", json={"status": "sent"})
+    assert response.status_code == 200, response.text
+    with sessionmaker(bind=engine)() as db:
+        assert db.get(models.Invoice, invoice["id"]).revision == 1
@@ -0,0 +1,84 @@
+import gc
+import logging
+import threading
+
+from sqlalchemy import text
+
+from fieldflux import db
+from fieldflux.metrics import Counter, Histogram, MetricsRegistry
+
+
+def test_sqlite_engine_applies_wal_and_pragmas(tmp_path):
+    engine = db.create_sqlite_engine(f"sqlite:///{tmp_path / 'wal.db'}", name="test-pragmas")
+
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == -64 * 1024
+
+    assert engine.pool.size() == db.POOL_SIZE
+
+
+def test_query_durations_recorded_and_slow_queries_logged(tmp_path, monkeypatch, caplog):
+    engine = db.create_sqlite_engine(f"sqlite:///{tmp_path / 'timing.db'}", name="test-timing")
+    monkeypatch.setattr(db, "SLOW_QUERY_SECONDS", 0.0)
+
+    with caplog.at_level(logging.WARNING, logger="fieldflux.db"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    snapshot = db.query_histogram("test-timing", "SELECT").snapshot()
+    assert snapshot["count"] == 1
+    assert "Slow SELECT query on test-timing" in caplog.text
+
+
+def test_counters_merge_thread_shards_and_render_exposition_format():
+    registry = MetricsRegistry()
+    hits = registry.register(Counter("test_hits_total", "Hits.", ("route",)))
+    assert registry.register(Counter("test_hits_total", "Duplicate.")) is hits
+
+    def work():
+        for _ in range(1000):
+            hits.inc("/a")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    hits.inc('/b"', amount=2)
+
+    assert hits.value("/a") == 4000
+    text = registry.render()
+    assert "# TYPE test_hits_total counter" in text
+    assert 'test_hits_total{route="/a"} 4000' in text
+    assert 'test_hits_total{route="/b\\""} 2' in text
+
+
+def test_pool_stats_report_checked_out_connections(tmp_path):
+    engine = db.create_sqlite_engine(f"sqlite:///{tmp_path / 'pool.db'}", name="test-pool")
+
+    with engine.connect():
+        stats = db.pool_stats()
+        assert stats[("test-pool", "checked_out")] == 1
+        assert stats[("test-pool", "size")] == db.POOL_SIZE
+    assert db.pool_stats()[("test-pool", "idle")] == 1
+
+
+def test_shards_of_exited_threads_are_folded_into_the_total():
+    hits = Counter("test_folded_total", "Hits.")
+    latency = Histogram()
+
+    def work():
+        hits.inc()
+        latency.observe(0.002)
+
+    for _ in range(200):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(hits._shards) == 0 and len(latency._shards) == 0
+    assert hits.value() == 200
+    assert latency.snapshot()["count"] == 200
@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import async_api, main, models
+from backend.analytics import seasonal_comparison_cache
+from backend.database import get_async_session, get_session
+from fieldflux.db import migrate_schema
+
+ADMIN = {"X-Role": "admin"}
+
+
+@pytest.fixture
+def client(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    SQLModel.metadata.create_all(engine)
+
+    def override_session():
+        with Session(engine) as session:
+            yield session
+
+    main.app.dependency_overrides[get_session] = override_session
+    main._report_cache.clear()
+    seasonal_comparison_cache.clear()
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def _seed(client):
+    north = client.post("/fields", json={"name": "North"}, headers=ADMIN).json()
+    south = client.post("/fields", json={"name": "South"}, headers=ADMIN).json()
+    events = [
+        (north["id"], "2022-04-10", "Urea", 120.0),
+        (north["id"], "2023-05-02", "Glyphosate", 1.5),
+        (south["id"], "2023-04-21", "Urea", 95.0),
+    ]
+    for field_id, event_date, product, rate in events:
+        response = client.post(
+            f"/fields/{field_id}/events",
+            json={"date": event_date, "product": product, "rate": rate, "operator": "sam"},
+            headers=ADMIN,
+        )
+        assert response.status_code == 200
+    return north, south
+
+
+def test_export_events_csv_filters_by_field_and_date(client):
+    north, _ = _seed(client)
+
+    response = client.get(
+        "/exports/events.csv",
+        params={"field_id": north["id"], "start_date": "2023-01-01"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["field_name"], row["product"]) for row in rows] == [("North", "Glyphosate")]
+
+
+def test_export_events_ndjson_filters_by_product(client):
+    _seed(client)
+
+    response = client.get("/exports/events.ndjson", params={"product": "urea"})
+
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["field_name"], r["date"], r["rate"]) for r in records] == [
+        ("North", "2022-04-10", 120.0),
+        ("South", "2023-04-21", 95.0),
+    ]
+
+
+def test_export_unknown_field_returns_404(client):
+    _seed(client)
+
+    response = client.get("/exports/events.csv", params={"field_id": 999})
+
+    assert response.status_code == 404
+
+
+def test_field_report_refreshes_after_new_event(client):
+    north, _ = _seed(client)
+
+    first = client.get(f"/reports/field/{north['id']}").json()
+    assert first == client.get(f"/reports/field/{north['id']}").json()
+    assert [s["season"] for s in first["summaries"]] == [2022, 2023]
+
+    client.post(
+        f"/fields/{north['id']}/events",
+        json={"date": "2023-06-01", "product": "Urea", "rate": 30.0, "operator": "sam"},
+        headers=ADMIN,
+    )
+
+    report = client.get(f"/reports/field/{north['id']}").json()
+    assert len(report["events"]) == 3
+    urea_2023 = [s for s in report["summaries"] if s["season"] == 2023 and s["product"] == "Urea"]
+    assert urea_2023 == [{"season": 2023, "product": "Urea", "total_rate": 30.0, "event_count": 1}]
+    assert client.get("/reports/field/999").status_code == 404
+
+
+def test_seasonal_comparison_ranks_fields_and_tracks_new_events(client):
+    north, south = _seed(client)
+    client.post(
+        f"/fields/{north['id']}/events",
+        json={"date": "2023-03-15", "product": "Urea", "rate": 150.0, "operator": "sam"},
+        headers=ADMIN,
+    )
+
+    rows = client.get("/analytics/seasonal-comparison", params={"product": "Urea"}).json()
+
+    by_key = {(row["field_id"], row["season"]): row for row in rows}
+    assert by_key[(north["id"], 2023)]["yoy_delta"] == 30.0
+    assert by_key[(north["id"], 2023)]["percentile_rank"] == 100.0
+    assert by_key[(south["id"], 2023)]["percentile_rank"] == 0.0
+    assert by_key[(north["id"], 2022)]["yoy_delta"] is None
+
+    client.post(
+        f"/fields/{south['id']}/events",
+        json={"date": "2023-07-01", "product": "Urea", "rate": 100.0, "operator": "sam"},
+        headers=ADMIN,
+    )
+    rows = client.get(
+        "/analytics/seasonal-comparison", params={"season": 2023, "field_id": south["id"]}
+    ).json()
+    assert rows == [
+        {
+            "field_id": south["id"],
+            "season": 2023,
+            "product": "Urea",
+            "total_rate": 195.0,
+            "event_count": 2,
+            "yoy_delta": None,
+            "percentile_rank": 100.0,
+        }
+    ]
+
+
+def test_async_handlers_match_sync_behaviour(tmp_path):
+    db_path = tmp_path / "async.db"
+    SQLModel.metadata.create_all(create_engine(f"sqlite:///{db_path}"))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+
+    async def override_async_session():
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(async_api.router)
+    app.dependency_overrides[get_async_session] = override_async_session
+    client = TestClient(app)
+
+    field = client.post("/fields", json={"name": "Async"}, headers=ADMIN).json()
+    for event_date in ("2023-04-01", "2024-04-01"):
+        response = client.post(
+            f"/fields/{field['id']}/events",
+            json={"date": event_date, "product": "Urea", "rate": 50.0, "operator": "ann"},
+            headers=ADMIN,
+        )
+        assert response.status_code == 200
+
+    events = client.get(f"/fields/{field['id']}/events", params={"start_date": "2024-01-01"})
+    assert [event["date"] for event in events.json()] == ["2024-04-01"]
+    summary = client.get(f"/fields/{field['id']}/events/summary").json()
+    assert [row["season"] for row in summary] == [2023, 2024]
+    assert client.post("/fields/999/events", json={}, headers=ADMIN).status_code == 422
+    assert client.get("/fields/999/events").status_code == 404
+
+
+def test_startup_migration_adds_field_event_revision(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE field (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, location VARCHAR)"
+        )
+        connection.exec_driver_sql("INSERT INTO field (name) VALUES ('North')")
+
+    applied = migrate_schema(engine, SQLModel.metadata)
+
+    assert "ALTER TABLE field ADD COLUMN event_revision INTEGER NOT NULL DEFAULT 0" in applied
+    assert migrate_schema(engine, SQLModel.metadata) == []
+    with Session(engine) as session:
+        assert session.get(models.Field, 1).event_revision == 0
+
+
+def test_interleaved_event_adds_each_bump_the_field_revision(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        field = models.Field(name="North")
+        session.add(field)
+        session.commit()
+        field_id = field.id
+    event = models.ApplicationEventCreate(
+        date="2024-04-01", product="Urea", rate=50.0, operator="ann"
+    )
+
+    with Session(engine) as first, Session(engine) as second:
+        # Both sessions hold the field at revision 0 before either commits.
+        loaded = [first.get(models.Field, field_id), second.get(models.Field, field_id)]
+        assert [field.event_revision for field in loaded] == [0, 0]
+        main.add_event(field_id, event, first)
+        main.add_event(field_id, event, second)
+
+    with Session(engine) as session:
+        assert session.get(models.Field, field_id).event_revision == 2